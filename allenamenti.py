@@ -0,0 +1,217 @@
+import json
+from collections import ChainMap
+import numpy as np
+import pandas as pd
+
+from diario import ELIMINAZIONE, safe_parse_json, id_righe, eliminati
+
+# ==========================================
+# 🏋️ ANALISI ALLENAMENTI (tabella colonnare dei set)
+# ==========================================
+CATEGORIE = {"pesi": "Pesi", "calisthenics": "Calisthenics", "isometria": "Isometria", "abs": "Abs", "cardio": "Cardio"}
+NUMERICHE = ["serie", "reps", "kg", "tempo", "km", "kcal"]
+COLONNE_SET = ["data", "id", "sessione", "nome", "type", "categoria"] + NUMERICHE + ["tonnellaggio", "e1rm", "tut"]
+
+
+def _vuota():
+    return pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c == "data" else float if c in COLONNE_SET[6:] else object) for c in COLONNE_SET})
+
+
+def tabella_set(allenamenti):
+    """Tabella allenamenti -> una riga per esercizio registrato (serie × reps @ kg), colonne tipizzate.
+
+    id = ID della riga di diario (per eliminazioni e aggiornamenti incrementali).
+    tonnellaggio = kg × serie × reps, e1rm = massimale stimato (Epley, solo pesi),
+    tut = secondi sotto tensione (tempo × serie, solo isometria).
+    """
+    if allenamenti.empty: return _vuota()
+    n = allenamenti["esercizi"].str.len().fillna(0).astype(int).to_numpy()
+    if not n.sum(): return _vuota()
+    es = pd.DataFrame([e if isinstance(e, dict) else {} for lst in allenamenti["esercizi"] for e in lst])
+    t = es.reindex(columns=["nome", "type"] + NUMERICHE)
+    t["type"] = t["type"].fillna("pesi").astype(str)
+    t["nome"] = t["nome"].fillna("").astype(str).str.strip()
+    t[NUMERICHE] = t[NUMERICHE].apply(pd.to_numeric, errors="coerce")
+    t.insert(0, "data", np.repeat(allenamenti["data"].to_numpy(), n))
+    t.insert(1, "id", np.repeat(allenamenti.index.to_numpy(), n))
+    t.insert(2, "sessione", np.repeat(allenamenti["nome_sessione"].to_numpy(), n))
+    t.insert(5, "categoria", t["type"].map(CATEGORIE).fillna("Pesi"))
+    kg, serie, reps = t["kg"].fillna(0.0), t["serie"].fillna(0.0), t["reps"].fillna(0.0)
+    carico = t["type"].isin(["pesi", "calisthenics", "abs"])
+    t["tonnellaggio"] = (kg * serie * reps).where(carico, 0.0)
+    # Epley: kg × (1 + reps/30); con 1 rep il massimale è il carico stesso
+    t["e1rm"] = np.where(reps > 1, kg * (1 + reps / 30), kg)
+    t["e1rm"] = t["e1rm"].where((t["type"] == "pesi") & (kg > 0) & (reps > 0))
+    t["tut"] = (t["tempo"] * serie).where(t["type"] == "isometria", 0.0)
+    return t
+
+
+def _allenamenti(righe):
+    """Righe 'allenamento' grezze -> stesse colonne della tabella allenamenti (senza normalizzare tutto il diario)"""
+    recs = [safe_parse_json(x) for x in righe["dettaglio_json"]]
+    return pd.DataFrame({"data": pd.to_datetime(righe["data"], errors="coerce").to_numpy(),
+                         "nome_sessione": [r.get("nome_sessione", "Workout") for r in recs],
+                         "esercizi": [r.get("esercizi") if isinstance(r.get("esercizi"), list) else [] for r in recs]},
+                        index=pd.Index(id_righe(righe).to_numpy(), name="id"))
+
+
+def aggiorna_set(tab, righe, segno=1):
+    """Aggiornamento incrementale (stessa firma di aggiorna_norm): append di sessioni o eliminazioni"""
+    if segno < 0: return tab[~tab["id"].isin(id_righe(righe))]
+    morti = eliminati(righe)
+    if morti: tab = tab[~tab["id"].isin(morti)]
+    # Pasti, acqua, misure: niente da fare (nessun parsing)
+    if "tipo" not in righe.columns or not (righe["tipo"] == "allenamento").any(): return tab
+    nuove = tabella_set(_allenamenti(righe[righe["tipo"] == "allenamento"]))
+    if nuove.empty: return tab
+    out = pd.concat([tab, nuove], ignore_index=True) if len(tab) else nuove
+    # Sessione retrodatata (calendario): si riordina, altrimenti resta ordinata per data
+    return out if out["data"].is_monotonic_increasing else out.sort_values("data", kind="stable", ignore_index=True)
+
+
+def volume_settimanale(tab, misura="serie", settimane=None):
+    """Volume per settimana (righe) e categoria (colonne): serie totali, oppure tonnellaggio/tut.
+
+    settimane: solo le ultime N settimane (tabella ordinata per data: taglio con ricerca binaria).
+    """
+    if tab.empty: return pd.DataFrame()
+    d = tab["data"]
+    if settimane:
+        ultimo = d.iloc[-1].normalize()
+        inizio = ultimo - pd.Timedelta(days=ultimo.dayofweek + 7 * (settimane - 1))  # lunedì di N settimane fa
+        tab = tab.iloc[d.values.searchsorted(np.datetime64(inizio), "left"):]; d = tab["data"]
+    lunedi = (d - pd.to_timedelta(d.dt.dayofweek, unit="D")).dt.normalize().rename("data")
+    v = tab.groupby([lunedi, tab["categoria"]])[misura].sum().unstack(fill_value=0)
+    return v[v.sum(axis=1) > 0]
+
+
+def progressione(tab, nome):
+    """Un esercizio giorno per giorno: miglior e1rm, carico massimo, tonnellaggio e tut totali"""
+    t = tab[tab["nome"] == nome]
+    if t.empty: return pd.DataFrame(columns=["data", "e1rm", "kg", "tonnellaggio", "tut"])
+    g = t.groupby(t["data"].dt.normalize())
+    return pd.DataFrame({"e1rm": g["e1rm"].max(), "kg": g["kg"].max(), "tonnellaggio": g["tonnellaggio"].sum(),
+                         "tut": g["tut"].sum()}).rename_axis("data").reset_index()
+
+
+# ==========================================
+# 🏆 RECORD PERSONALI (indice per esercizio)
+# ==========================================
+def _voce_pr():
+    return {"kg": np.nan, "e1rm": np.nan, "reps": {}, "tempo": np.nan, "km": np.nan, "passo": np.nan, "ultimo": None}
+
+
+def _migliore(a, b, minimo=False):
+    """Il migliore tra due valori che possono mancare (NaN)"""
+    if pd.isna(b): return a
+    if pd.isna(a): return b
+    return min(a, b) if minimo else max(a, b)
+
+
+def _registra(voce, r):
+    """Aggiorna la voce con un esercizio (dict della tabella set): costo costante"""
+    voce["kg"] = _migliore(voce["kg"], r["kg"])
+    voce["e1rm"] = _migliore(voce["e1rm"], r["e1rm"])
+    if r["type"] == "isometria": voce["tempo"] = _migliore(voce["tempo"], r["tempo"])
+    elif r["type"] == "cardio":
+        voce["km"] = _migliore(voce["km"], r["km"])
+        if r["km"] > 0 and r["tempo"] > 0: voce["passo"] = _migliore(voce["passo"], r["tempo"] / r["km"], minimo=True)
+    elif pd.notna(r["reps"]):
+        kg = float(r["kg"]) if pd.notna(r["kg"]) else 0.0
+        voce["reps"][kg] = _migliore(voce["reps"].get(kg, np.nan), r["reps"])
+    voce["ultimo"] = r
+
+
+def indice_pr(tab):
+    """Tabella set -> {(nome, type): record} con carico massimo, 1RM stimato, reps massime per carico,
+    tenuta più lunga (isometria), distanza massima e passo migliore in min/km (cardio), ultima esecuzione."""
+    t = tab[tab["nome"] != ""]
+    if t.empty: return {}
+    chiave = ["nome", "type"]
+    iso, cardio = t["type"] == "isometria", t["type"] == "cardio"
+    passo = (t["tempo"] / t["km"]).where(cardio & (t["km"] > 0) & (t["tempo"] > 0))
+    rec = pd.DataFrame({"kg": t.groupby(chiave)["kg"].max(), "e1rm": t.groupby(chiave)["e1rm"].max(),
+                        "tempo": t[iso].groupby(chiave)["tempo"].max(), "km": t[cardio].groupby(chiave)["km"].max(),
+                        "passo": passo.groupby([t["nome"], t["type"]]).min()})
+    indice = {k: {**_voce_pr(), **v} for k, v in rec.to_dict("index").items()}
+    c = t[~iso & ~cardio & t["reps"].notna()]
+    for (nome, tipo, kg), reps in c.groupby(chiave + [c["kg"].fillna(0.0).rename("carico")])["reps"].max().items():
+        indice[nome, tipo]["reps"][float(kg)] = reps
+    # Tabella ordinata per data: l'ultima riga di ogni esercizio è l'ultima volta
+    for r in t.groupby(chiave).tail(1).to_dict("records"): indice[r["nome"], r["type"]]["ultimo"] = r
+    return indice
+
+
+LIVELLI_PR = 16  # livelli di aggiorna_pr sopra l'indice prima di compattarlo
+
+
+def aggiorna_pr(indice, righe, segno=1):
+    """Nuove sessioni: O(esercizi toccati). Le voci toccate si copiano in un livello nuovo sopra
+    l'indice in cache (ChainMap), che resta intatto per chi lo sta leggendo; ogni LIVELLI_PR
+    salvataggi i livelli si compattano in un dict (O(esercizi), ammortizzato).
+    Un allenamento eliminato può togliere un record: None = indice da ricostruire (dalla tabella set, già aggiornata)"""
+    if "tipo" not in righe.columns: return indice
+    if segno < 0: return None if (righe["tipo"] == "allenamento").any() else indice
+    tomb = righe.loc[righe["tipo"] == ELIMINAZIONE, "dettaglio_json"]
+    if any(safe_parse_json(js).get("tipo") == "allenamento" for js in tomb): return None
+    nuove = righe[righe["tipo"] == "allenamento"]
+    if nuove.empty: return indice
+    toccate = {}
+    for r in tabella_set(_allenamenti(nuove)).to_dict("records"):
+        if not r["nome"]: continue
+        k = (r["nome"], r["type"])
+        if k not in toccate:
+            v = indice.get(k)
+            toccate[k] = _voce_pr() if v is None else {**v, "reps": dict(v["reps"])}
+        _registra(toccate[k], r)
+    livelli = indice.maps if isinstance(indice, ChainMap) else [indice]
+    if len(livelli) >= LIVELLI_PR: livelli = [dict(ChainMap(*livelli))]
+    return ChainMap(toccate, *livelli)
+
+
+def unisci_voci(vecchia, nuova):
+    """Record di due periodi (es. anni archiviati + diario caldo): il migliore per campo, l'ultima volta dal più recente"""
+    if vecchia is None: return nuova
+    if nuova is None: return vecchia
+    out = {k: _migliore(vecchia[k], nuova[k], minimo=(k == "passo")) for k in ["kg", "e1rm", "tempo", "km", "passo"]}
+    out["reps"] = {**vecchia["reps"], **{kg: _migliore(vecchia["reps"].get(kg, np.nan), r) for kg, r in nuova["reps"].items()}}
+    out["ultimo"] = nuova["ultimo"] or vecchia["ultimo"]
+    return out
+
+
+# Foglio dei record degli anni archiviati: una riga per (anno, esercizio)
+COLONNE_RECORD = ["anno", "nome", "type", "kg", "e1rm", "tempo", "km", "passo", "reps", "ultimo"]
+_ULTIMO = ["serie", "reps", "kg", "tempo", "km"]
+
+
+def righe_record(indice, anno):
+    """Indice -> righe del foglio record (reps per carico e ultima volta come JSON)"""
+    righe = []
+    for (nome, tipo), v in indice.items():
+        u = v["ultimo"] or {}
+        ultimo = {"data": u["data"].strftime("%Y-%m-%d") if pd.notna(u.get("data")) else "", **{k: None if pd.isna(u.get(k)) else float(u[k]) for k in _ULTIMO}}
+        righe.append({"anno": anno, "nome": nome, "type": tipo, **{k: v[k] for k in ["kg", "e1rm", "tempo", "km", "passo"]},
+                      "reps": json.dumps({str(kg): r for kg, r in v["reps"].items()}), "ultimo": json.dumps(ultimo)})
+    return pd.DataFrame(righe, columns=COLONNE_RECORD)
+
+
+def indice_da_record(df):
+    """Foglio record -> indice come indice_pr, anni fusi in ordine cronologico"""
+    if df.empty or "nome" not in df.columns: return {}
+    r = df.reindex(columns=COLONNE_RECORD).assign(**{c: lambda d, c=c: pd.to_numeric(d[c], errors="coerce") for c in ["anno", "kg", "e1rm", "tempo", "km", "passo"]})
+    indice = {}
+    for x in r.sort_values("anno", kind="stable").to_dict("records"):
+        u = safe_parse_json(x["ultimo"])
+        ultimo = {"data": pd.to_datetime(u.get("data"), errors="coerce"), "nome": x["nome"], "type": x["type"],
+                  **{k: np.nan if u.get(k) is None else u[k] for k in _ULTIMO}}
+        voce = {**{k: x[k] for k in ["kg", "e1rm", "tempo", "km", "passo"]},
+                "reps": {float(kg): reps for kg, reps in safe_parse_json(x["reps"]).items()}, "ultimo": ultimo}
+        chiave = (str(x["nome"]), str(x["type"]))
+        indice[chiave] = unisci_voci(indice.get(chiave), voce)
+    return indice
+
+
+def sostituisci_record(df, anno, righe):
+    """Foglio record con le righe dell'anno rigenerate"""
+    if df.empty or "anno" not in df.columns: return righe
+    return pd.concat([df[pd.to_numeric(df["anno"], errors="coerce") != anno], righe], ignore_index=True)
@@ -0,0 +1,146 @@
+import hashlib
+import pandas as pd
+
+from diario import ELIMINAZIONE, MACRO, TABELLE, id_righe, safe_parse_json, aggrega
+
+# ==========================================
+# 🗄️ ARCHIVIO PER ANNO (diario caldo + partizioni + riepilogo)
+# ==========================================
+# Il foglio "diario" tiene solo gli anni recenti; gli anni chiusi finiscono in
+# "diario_<anno>" e in "diario_riepilogo" (una riga per giorno: totali, peso, conteggi).
+RIEPILOGO = "diario_riepilogo"
+RECORD = "diario_record"  # record per esercizio degli anni archiviati (vedi allenamenti.righe_record)
+ARCHIVIABILI = ["pasto", "acqua", "misure", "allenamento"]  # skill e settings restano nel diario
+COLONNE_RIEPILOGO = ["data"] + MACRO + ["acqua", "peso"] + [f"n_{t}" for t in ARCHIVIABILI]
+
+
+def foglio_anno(anno): return f"diario_{anno}"
+
+
+def anno_limite(oggi, anni_caldi=2):
+    """Primo anno che resta nel diario caldo (anni_caldi=2: anno corrente e precedente)"""
+    return oggi.year - anni_caldi + 1
+
+
+def _tombstone(df):
+    """Righe 'eliminazione' -> DataFrame (idx, bersaglio, anno del bersaglio se noto)"""
+    t = df[df["tipo"] == ELIMINAZIONE]
+    dati = [safe_parse_json(x) for x in t["dettaglio_json"]]
+    anni = pd.to_datetime(pd.Series([d.get("data") for d in dati], index=t.index, dtype=object), errors="coerce").dt.year
+    return pd.DataFrame({"bersaglio": [d.get("id") for d in dati], "anno": anni}, index=t.index)
+
+
+def pianifica_archivio(df, limite):
+    """Diario caldo -> (nuovo diario caldo, {anno: (righe da archiviare, id da togliere)}).
+
+    - righe archiviabili con anno < limite: spostate nella partizione del loro anno
+    - coppie riga+tombstone entrambe nel diario: compattate (spariscono tutte e due)
+    - tombstone di righe già archiviate (anno noto < limite): applicati alla partizione
+    Piano vuoto ({}) se non c'è niente da spostare.
+    """
+    if df.empty or "tipo" not in df.columns: return df, {}
+    df = df.assign(id=id_righe(df))
+    tomb = _tombstone(df)
+    locali = tomb["bersaglio"].isin(df["id"])
+    colpite = df["id"].isin(tomb.loc[locali, "bersaglio"])
+    anno = pd.to_datetime(df["data"], errors="coerce").dt.year
+    sposta = ~colpite & df["tipo"].isin(ARCHIVIABILI) & (anno < limite)
+    remoti = tomb[~locali & (tomb["anno"] < limite)]
+    if not sposta.any() and remoti.empty: return df, {}
+    piano = {}
+    for a, righe in df[sposta].groupby(anno[sposta].astype(int)):
+        piano[a] = (righe, set())
+    for a, t in remoti.groupby(remoti["anno"].astype(int)):
+        piano.setdefault(a, (df.iloc[:0], set()))[1].update(t["bersaglio"])
+    via = colpite | sposta | df.index.isin(tomb.index[locali]) | df.index.isin(remoti.index)
+    return df[~via].reset_index(drop=True), piano
+
+
+def basi_incoerenti(riepilogo, partizioni):
+    """Partizioni lette dall'archiviazione -> motivo per non riscriverle, None se coerenti.
+
+    Un foglio vuoto per un anno che il riepilogo dà per archiviato vuol dire una lettura
+    sbagliata: riscriverlo da lì cancellerebbe l'archivio.
+    """
+    anni = set(anni_archiviati(leggi_riepilogo(riepilogo)))
+    for anno, part in partizioni.items():
+        if anno in anni and part.empty: return f"{foglio_anno(anno)} vuoto ma presente nel riepilogo"
+        if not anni and not part.empty: return f"{RIEPILOGO} vuoto con {foglio_anno(anno)} già archiviato"
+    return None
+
+
+def unisci_partizione(partizione, nuove, via):
+    """Partizione esistente + righe spostate, senza le righe eliminate e senza doppioni per ID"""
+    p = pd.concat([partizione, nuove], ignore_index=True) if len(partizione.columns) else nuove.reset_index(drop=True)
+    p = p.assign(id=id_righe(p))
+    p = p[~p["id"].isin(via)].drop_duplicates("id")
+    return p.sort_values("data", kind="stable").reset_index(drop=True)
+
+
+def riepilogo_giorni(norm):
+    """Una riga per giorno: totali macro e acqua, ultimo peso, numero di righe per tipo"""
+    giorni = aggrega(norm)["giorni"]
+    peso = norm["misure"].dropna(subset=["peso"]).groupby("data")["peso"].last()
+    conteggi = {f"n_{t}": norm[TABELLE[t]].groupby("data").size() for t in ARCHIVIABILI}
+    out = pd.concat([giorni, peso.rename("peso"), pd.DataFrame(conteggi)], axis=1)
+    out = out.reindex(columns=COLONNE_RIEPILOGO[1:])
+    out[[c for c in out.columns if c != "peso"]] = out[[c for c in out.columns if c != "peso"]].fillna(0)
+    out.index = out.index.strftime("%Y-%m-%d")  # stesso formato data del diario
+    return out.rename_axis("data").reset_index()
+
+
+def sostituisci_anno(riepilogo, anno, righe):
+    """Riepilogo con le righe dell'anno rigenerate"""
+    if riepilogo.empty or "data" not in riepilogo.columns: return righe
+    altri = riepilogo[pd.to_datetime(riepilogo["data"], errors="coerce").dt.year != anno]
+    return pd.concat([altri, righe], ignore_index=True).sort_values("data", kind="stable").reset_index(drop=True)
+
+
+def leggi_riepilogo(df):
+    """Foglio riepilogo -> DataFrame tipizzato indicizzato per data (vuoto se manca)"""
+    if df.empty or "data" not in df.columns: return pd.DataFrame(columns=COLONNE_RIEPILOGO[1:], index=pd.DatetimeIndex([], name="data"))
+    r = df.reindex(columns=COLONNE_RIEPILOGO)
+    r = r.assign(**{c: pd.to_numeric(r[c], errors="coerce") for c in COLONNE_RIEPILOGO[1:]})
+    return r.assign(data=pd.to_datetime(r["data"], errors="coerce")).dropna(subset=["data"]).set_index("data").sort_index()
+
+
+def anni_archiviati(riep):
+    return sorted(set(riep.index.year))
+
+
+def impronta_anno(riep, anno):
+    """Impronta delle righe di riepilogo di un anno: cambia quando la partizione viene riscritta"""
+    return hashlib.sha1(riep[riep.index.year == anno].to_csv().encode()).hexdigest()[:16]
+
+
+def conteggi_archiviati(riep):
+    """Righe per tipo negli anni archiviati (per l'XP)"""
+    return {t: int(riep[f"n_{t}"].sum()) for t in ARCHIVIABILI if len(riep)}
+
+
+def misure_archiviate(riep):
+    """Peso giornaliero degli anni archiviati nel formato della tabella misure"""
+    return riep["peso"].dropna().rename_axis("data").reset_index()
+
+
+def giorni_storico(riep, giorni):
+    """Totali giornalieri archiviati + quelli del diario caldo (per lo stesso giorno vince il caldo)"""
+    if riep.empty: return giorni
+    u = pd.concat([riep[MACRO + ["acqua"]], giorni])
+    return u[~u.index.duplicated(keep="last")].sort_index()
+
+
+def unisci_norm(caldo, archivio):
+    """Tabelle del diario caldo + quelle di una partizione (ordinate per data, un ID una volta sola)"""
+    out = {}
+    for k, t in caldo.items():
+        a = archivio.get(k)
+        if a is None or a.empty: out[k] = t; continue
+        u = pd.concat([a, t])
+        out[k] = u[~u.index.duplicated()].sort_values("data", kind="stable")
+    return out
+
+
+def senza_eliminati(norm, morti):
+    """Tabelle di una partizione senza le righe eliminate da tombstone del diario caldo"""
+    return {k: t.drop(index=list(morti), errors="ignore") for k, t in norm.items()} if morti else norm
@@ -0,0 +1,494 @@
+"""Benchmark headless del data layer (nessuna connessione a Google Sheets).
+
+Uso:  python benchmark.py [scrittura sync concorrenza giorno peso ricerca coach rerun app archivio allenamenti pr scambio colonnare sessioni] [--json report.json]
+
+Senza argomenti esegue tutti i benchmark. I dati vengono da sintetico.py; "app" e "rerun"
+eseguono lo script vero dell'app con AppTest su una connessione finta in memoria.
+Se un controllo di correttezza fallisce (righe perse o ricomparse, ...) l'uscita è con stato 1.
+"""
+import gc
+import io
+import os
+import json
+import time
+import tempfile
+import statistics
+import tracemalloc
+import threading
+import pandas as pd
+
+from db_engine import MemorySheetBackend, SQLiteBackend, SyncedBackend, CodaScritture, nuova_riga_diario
+from diario import normalizza_diario, fetta, eliminati, ELIMINAZIONE
+from catalogo import IndiceCatalogo
+from peso import serie_peso, punti_grafico
+from allenamenti import tabella_set, aggiorna_set, volume_settimanale, progressione, indice_pr, aggiorna_pr
+from scambio import esporta, valida_import, lotti
+from archivio import RIEPILOGO, foglio_anno, anno_limite, pianifica_archivio, unisci_partizione, riepilogo_giorni, leggi_riepilogo
+from coach import Coach, StubClient, PROMPT_PT
+import colonnare
+import sintetico
+from sintetico import diario_sintetico, catalogo_sintetico, fogli_sintetici, ConnessioneFinta
+
+
+def _misura(fn, ripetizioni):
+    tempi = []
+    for _ in range(ripetizioni):
+        t0 = time.perf_counter(); fn(); tempi.append(time.perf_counter() - t0)
+    return statistics.median(tempi) * 1000
+
+
+def bench_scrittura(sizes=(1_000, 10_000, 100_000), ripetizioni=5):
+    """add_riga_diario: riscrittura completa (vecchio percorso) vs append-only"""
+    print("== Scrittura diario (ms mediani per riga registrata) ==")
+    print(f"{'righe':>8} | {'rewrite ms':>10} | {'append ms':>9} | {'celle rewrite':>13} | {'celle append':>12}")
+    for n in sizes:
+        base = diario_sintetico(n)
+        nuova = nuova_riga_diario("acqua", {"ml": 250}, "2024-01-01")
+
+        be_old = MemorySheetBackend({"diario": base})
+        df_cache = be_old.read("diario")
+        def rewrite():
+            be_old.update("diario", pd.concat([df_cache, nuova], ignore_index=True).fillna(""))
+        be_old.celle_inviate = 0
+        t_old = _misura(rewrite, ripetizioni)
+        celle_old = be_old.celle_inviate // ripetizioni
+
+        be_new = MemorySheetBackend({"diario": base})
+        be_new.celle_inviate = 0
+        t_new = _misura(lambda: be_new.append("diario", nuova), ripetizioni)
+        celle_new = be_new.celle_inviate // ripetizioni
+
+        print(f"{n:>8} | {t_old:>10.2f} | {t_new:>9.3f} | {celle_old:>13} | {celle_new:>12}")
+
+
+def bench_sync(n=10_000, latenza=0.2, ripetizioni=5):
+    """Store locale SQLite davanti a un foglio remoto lento (latenza simulata)"""
+    print(f"== Store locale + sync ({n} righe, latenza remota {latenza * 1000:.0f} ms) ==")
+    remoto = MemorySheetBackend({"diario": diario_sintetico(n)}, latenza=latenza)
+    with tempfile.TemporaryDirectory() as d:
+        a = SyncedBackend(SQLiteBackend(os.path.join(d, "a.db")), remoto)
+        b = SyncedBackend(SQLiteBackend(os.path.join(d, "b.db")), remoto)
+        t0 = time.perf_counter(); a.read("diario"); b.read("diario")
+        print(f"cold start (pull)      : {(time.perf_counter() - t0) / 2 * 1000:8.1f} ms")
+        print(f"lettura remota         : {_misura(lambda: remoto.read('diario'), 3):8.1f} ms")
+        print(f"lettura locale         : {_misura(lambda: a.read('diario'), ripetizioni):8.1f} ms")
+        nuova = nuova_riga_diario("acqua", {"ml": 250}, "2024-01-01")
+        print(f"scrittura locale       : {_misura(lambda: a.append('diario', nuova), ripetizioni):8.2f} ms")
+
+        # Due client scrivono in parallelo: dopo il sync nessuna riga deve mancare
+        for _ in range(ripetizioni): b.append("diario", nuova_riga_diario("acqua", {"ml": 500}, "2024-01-02"))
+        t0 = time.perf_counter(); a.flush(); b.flush()
+        print(f"sync a lotti (2 client): {(time.perf_counter() - t0) * 1000:8.1f} ms")
+        attese = n + 2 * ripetizioni
+        righe = len(remoto.read("diario"))
+        print(f"righe sul foglio       : {righe} (attese {attese}) {'OK' if righe == attese else 'PERSE!'}")
+
+
+FALLITI = []  # controlli di correttezza non superati: a fine esecuzione exit status 1
+
+
+def _verifica(ok, nome):
+    """Esito di un controllo: 'OK' o 'ERRORE!' da stampare, e se fallisce lo ricorda per l'exit status"""
+    if not ok: FALLITI.append(nome)
+    return "OK" if ok else "ERRORE!"
+
+
+def _in_parallelo(fn, n):
+    threads = [threading.Thread(target=fn, args=(i,)) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+
+def bench_concorrenza(sessioni=8, righe=20, latenza=0.002):
+    """Stress test: N sessioni che scrivono insieme sul diario, nessuna riga deve andare persa"""
+    print(f"== Sessioni concorrenti ({sessioni} sessioni x {righe} righe, latenza {latenza * 1000:.0f} ms) ==")
+    base = diario_sintetico(100)
+
+    # Vecchio percorso: ogni add_riga_diario legge e riscrive tutto il foglio
+    remoto = MemorySheetBackend({"diario": base}, latenza=latenza)
+    def sessione_rmw(s):
+        for i in range(righe):
+            df = remoto.read("diario")
+            remoto.update("diario", pd.concat([df, nuova_riga_diario("acqua", {"ml": s * 1000 + i})], ignore_index=True).fillna(""))
+    _in_parallelo(sessione_rmw, sessioni)
+    perse = len(base) + sessioni * righe - len(remoto.read("diario"))
+    print(f"read-modify-write      : righe perse {perse}")
+
+    # Nuovo: append + tombstone, due server (due code) sullo stesso foglio
+    remoto = MemorySheetBackend({"diario": base}, latenza=latenza)
+    server = [CodaScritture(remoto), CodaScritture(remoto)]
+    attesi, lock = set(), threading.Lock()
+    def sessione(s):
+        coda, mie = server[s % 2], []
+        for i in range(righe):
+            riga = nuova_riga_diario("acqua", {"ml": s * 1000 + i})
+            coda.append("diario", riga); mie.append(riga["id"].iloc[0])
+            if i % 5 == 4:  # ogni tanto elimina una delle sue righe
+                coda.append("diario", nuova_riga_diario(ELIMINAZIONE, {"id": mie.pop(0), "tipo": "acqua"}))
+        with lock: attesi.update(mie)
+    t0 = time.perf_counter()
+    _in_parallelo(sessione, sessioni)
+    for c in server: c.attendi()
+    presenti = set(normalizza_diario(remoto.read("diario"))["acqua"].index)
+    iniziali = set(normalizza_diario(base)["acqua"].index)
+    mancanti, ricomparse = attesi - presenti, presenti - attesi - iniziali
+    print(f"append + tombstone     : {(time.perf_counter() - t0) * 1000:8.1f} ms, righe perse {len(mancanti)}, "
+          f"eliminate ricomparse {len(ricomparse)} {_verifica(not mancanti and not ricomparse, 'concorrenza: append + tombstone')}")
+
+    # Riscrittura da una versione vecchia (catalogo): controllo di versione + fusione
+    remoto = MemorySheetBackend({"cibi": catalogo_sintetico(50)}, latenza=latenza)
+    coda = CodaScritture(remoto)
+    vista = remoto.read("cibi")  # la sessione A legge il catalogo...
+    altri = catalogo_sintetico(sessioni, seed=1).assign(nome=lambda d: "Nuovo " + d["nome"])
+    for i in range(sessioni): remoto.append("cibi", altri.iloc[[i]])  # ...intanto altri server aggiungono cibi
+    coda.update("cibi", vista.iloc[1:], base=vista)  # ...e A ne elimina uno riscrivendo il foglio
+    coda.attendi()
+    nomi = set(remoto.read("cibi")["nome"])
+    ok = set(altri["nome"]) <= nomi and vista["nome"].iloc[0] not in nomi and len(nomi) == 49 + sessioni
+    print(f"riscrittura concorrente: conflitti fusi {coda.conflitti}, righe {len(nomi)} (attese {49 + sessioni}) {_verifica(ok, 'concorrenza: riscrittura')}")
+
+
+def _script_app(percorso):
+    # Eseguita da AppTest come script: l'app vera, con st.connection -> connessione finta
+    import runpy
+    import streamlit as st
+    import sintetico
+    import db_engine
+    st.connection = lambda *a, **k: sintetico.CONNESSIONE
+    db_engine.apri_spreadsheet = lambda cfg: sintetico.CONNESSIONE.spreadsheet
+    runpy.run_path(percorso, run_name="__main__")
+
+
+def _sessione():
+    """Nuova sessione (AppTest) dello script dell'app: cache e backend di processo restano condivisi"""
+    from streamlit.testing.v1 import AppTest
+    percorso = os.path.join(os.path.dirname(os.path.abspath(__file__)), "my-online-fitness-app.py")
+    at = AppTest.from_function(_script_app, args=(percorso,), default_timeout=600)
+    at.secrets["DEV"] = True
+    at.secrets["ANNI_CALDI"] = 0  # diario sintetico dal 2015: niente archivio, si misura il diario intero
+    at.session_state["password_correct"] = True
+    return at
+
+
+def _app(fogli, latenza=0.0):
+    """AppTest dell'app su fogli in memoria (GSheetsBackend + ConnessioneFinta), pannello DEV attivo"""
+    import streamlit as st
+    st.cache_resource.clear()  # backend, cache e profilo nuovi per ogni prova
+    sintetico.CONNESSIONE = ConnessioneFinta(MemorySheetBackend(fogli, latenza=latenza))
+    return _sessione()
+
+
+def _download_differito(at, etichetta, passo):
+    """Download di un st.download_button con callable, per la stessa strada del server: il rerun
+    (passo) registra il callable nel MediaFileManager, execute_deferred lo esegue e ne converte il risultato"""
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    gestori, orig = {}, MediaFileManager.add_deferred
+    def add_deferred(self, *a, **k):
+        fid = orig(self, *a, **k); gestori[fid] = self
+        return fid
+    MediaFileManager.add_deferred = add_deferred
+    try: passo()
+    finally: MediaFileManager.add_deferred = orig
+    fid = next(b.proto.deferred_file_id for b in at.get("download_button") if b.proto.label == etichetta)
+    url = gestori[fid].execute_deferred(fid)
+    return gestori[fid]._storage.get_file(url.rsplit("/", 1)[-1]).content
+
+
+def _profilo(at):
+    """Tabella del pannello '🛠️ Performance' (fase -> medio_ms)"""
+    t = at.sidebar.dataframe[0].value
+    return dict(zip(t["fase"], t["medio_ms"]))
+
+
+def bench_rerun(n=20_000, ripetizioni=5):
+    """Click su widget ad alta frequenza: rerun completo dello script vs corpo del solo fragment.
+
+    AppTest esegue sempre lo script intero; il tempo del fragment è quello registrato
+    dal fragment stesso (session_state["tempi"]), cioè quanto costa un suo rerun isolato.
+    """
+    print(f"== Rerun pagina vs fragment (diario {n} righe) ==")
+    at = _app(fogli_sintetici(n))
+    at.run()
+    def clic(azione, fragment):
+        pagina, frag = [], []
+        for _ in range(ripetizioni):
+            azione(); pagina.append(at.session_state["tempi"]["pagina"]); frag.append(at.session_state["tempi"][fragment])
+        print(f"{fragment:<17}: script completo {statistics.median(pagina):7.1f} ms | fragment {statistics.median(frag):6.1f} ms")
+    clic(lambda: at.button(key="btn_w_quick").click().run(), "acqua")
+    at.button_group(key="sezione").set_value("🍎 Alimentazione").run()
+    at.selectbox(key="f_sel").set_value(at.selectbox(key="f_sel").options[1]).run()
+    clic(lambda: at.number_input(key="f_gr").increment().run(), "form_cibo")
+    at.button_group(key="sezione").set_value("🏋️ Workout").run()
+    at.text_input(key="w_nm").set_value("Squat").run()
+    clic(lambda: at.button(key="wb").click().run(), "sessione_workout")
+
+
+FASI_APP = ["fetch:diario", "normalizza", "get_user_settings", "calculate_user_level", "tab1:aggregazione",
+            "add_riga_diario", "delete_riga", "normalizza:incr", "pagina:📊 Dashboard"]
+
+
+def bench_app(sizes=(1_000, 10_000, 50_000), ripetizioni=5, latenza=0.0):
+    """Funzioni dati dell'app (script vero, fogli sintetici in memoria): tempo medio per fase.
+
+    Ritorna il report {righe: {fase: ms}} (confrontabile tra release con --json).
+    """
+    print(f"== Funzioni dati dell'app (ms medi, {ripetizioni} ripetizioni) ==")
+    print(f"{'fase':<22} | " + " | ".join(f"{n:>9}" for n in sizes))
+    report = {}
+    for n in sizes:
+        at = _app(fogli_sintetici(n), latenza)
+        at.run()                                           # cold start: fetch + normalizzazione
+        for _ in range(ripetizioni): at.run()              # rerun a cache calda
+        for _ in range(ripetizioni): at.button(key="btn_w_quick").click().run()  # add_riga_diario
+        at.button_group(key="sezione").set_value("🤸 Calisthenics").run()
+        for _ in range(ripetizioni):                       # delete_riga (tombstone)
+            skill = [b for b in at.button if b.key and b.key.startswith("dc_")]
+            if skill: skill[0].click().run()
+        at.button_group(key="sezione").set_value("📊 Dashboard").run()
+        report[n] = _profilo(at)
+    for fase in FASI_APP:
+        print(f"{fase:<22} | " + " | ".join(f"{report[n].get(fase, float('nan')):>9.2f}" for n in sizes))
+    return report
+
+
+def bench_sessioni(n=20_000, sessioni=(1, 50)):
+    """Memoria con N sessioni aperte: fogli, diario normalizzato e cataloghi una volta per processo,
+    per sessione solo lo stato dei widget e i delta (buffer, sessione workout, chat).
+    Il costo per sessione comprende anche l'albero degli elementi che AppTest tiene per ogni prova."""
+    print(f"== Sessioni concorrenti (diario {n} righe, memoria Python tracciata) ==")
+    print(f"{'sessioni':>8} | {'totale MB':>9} | {'1a sessione MB':>14} | {'in più MB/sessione':>18} | {'copie per sessione MB':>21}")
+    fogli = fogli_sintetici(n)
+    def giro(at):  # dashboard, ricerca cibi, workout, skill: tutti i dati condivisi vengono toccati
+        at.run()
+        for sezione in ["🍎 Alimentazione", "🏋️ Workout", "🤸 Calisthenics"]: at.button_group(key="sezione").set_value(sezione).run()
+        return at
+    giro(_app(fogli))  # import dei moduli e primo exec dello script fuori dalla misura
+    for k in sessioni:
+        gc.collect(); tracemalloc.start()
+        aperte = [giro(_app(fogli))]
+        gc.collect()
+        prima = tracemalloc.get_traced_memory()[0] / 2**20
+        aperte += [giro(_sessione()) for _ in range(k - 1)]
+        gc.collect()
+        totale = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+        per = (totale - prima) / (k - 1) if k > 1 else 0.0
+        # Stima se ogni sessione tenesse la sua copia di fogli e derivati (vecchio df per sessione)
+        print(f"{k:>8} | {totale:>9.1f} | {prima:>14.1f} | {per:>18.2f} | {prima * k:>21.1f}")
+        del aperte
+
+
+def bench_giorno(sizes=(10_000, 100_000, 1_000_000), ripetizioni=20):
+    """Cambio data nella sidebar: filtro per stringa sull'intero diario vs ricerca binaria"""
+    print("== Cambio giorno (ms mediani) ==")
+    print(f"{'righe':>8} | {'scan df==data':>13} | {'fetta indice':>12} | {'streak scan':>11} | {'streak indice':>13}")
+    for n in sizes:
+        df = diario_sintetico(n)
+        norm = normalizza_diario(df)
+        giorni = df["data"].unique()
+        g = giorni[len(giorni) // 2]
+        t_scan = _misura(lambda: df[df["data"] == g], ripetizioni)
+        t_idx = _misura(lambda: [fetta(t, g) for t in norm.values()], ripetizioni)
+        # Streak come nell'app: giorni con un allenamento negli ultimi 7
+        t_streak_old = _misura(lambda: set(df[df["tipo"] == "allenamento"]["data"]), ripetizioni)
+        fine = pd.Timestamp(g); inizio = fine - pd.Timedelta(days=6)
+        t_streak_new = _misura(lambda: set(fetta(norm["allenamenti"], inizio, fine)["data"].dt.strftime("%Y-%m-%d")), ripetizioni)
+        print(f"{n:>8} | {t_scan:>13.2f} | {t_idx:>12.3f} | {t_streak_old:>11.2f} | {t_streak_new:>13.3f}")
+
+
+def bench_peso(anni=(1, 5, 10), ripetizioni=5):
+    """Grafico peso: lista + tutti i punti grezzi ad ogni rerun vs serie in cache + LTTB"""
+    import altair as alt
+    print("== Andamento peso (pesata giornaliera) ==")
+    print(f"{'giorni':>7} | {'lista+chart ms':>14} | {'payload KB':>10} | {'serie ms (1 volta)':>18} | {'punti ms':>8} | {'payload KB':>10}")
+    for a in anni:
+        date = pd.date_range("2015-01-01", periods=365 * a, freq="D")
+        misure = pd.DataFrame({"data": date, "peso": 80 + (pd.Series(range(len(date))) % 60 - 30).to_numpy() / 20.0})
+        def vecchio():
+            lista = [{"Data": d.strftime("%Y-%m-%d"), "Peso": float(p)} for d, p in zip(misure["data"], misure["peso"])]
+            return alt.Chart(pd.DataFrame(lista)).mark_line(point=True).encode(x="Data:T", y="Peso:Q").to_json()
+        t_old = _misura(vecchio, ripetizioni)
+        t_serie = _misura(lambda: serie_peso(misure), ripetizioni)
+        serie = serie_peso(misure)
+        def nuovo():
+            return alt.Chart(punti_grafico(serie)[["data", "peso", "trend"]]).mark_line(point=True).encode(x="data:T", y="peso:Q").to_json()
+        t_new = _misura(nuovo, ripetizioni)
+        print(f"{len(date):>7} | {t_old:>14.1f} | {len(vecchio()) / 1024:>10.0f} | {t_serie:>18.1f} | {t_new:>8.1f} | {len(nuovo()) / 1024:>10.0f}")
+
+
+def bench_archivio(sizes=(10_000, 50_000, 100_000), ripetizioni=3, oggi="2026-06-01"):
+    """Avvio a freddo: diario con tutto lo storico vs diario caldo (ultimi 2 anni) + riepilogo giornaliero"""
+    print("== Archivio per anno (lettura + normalizzazione a cache fredda) ==")
+    print(f"{'righe':>7} | {'anni':>4} | {'tutto ms':>8} | {'caldo righe':>11} | {'caldo+riep ms':>13} | {'1 anno ms':>9}")
+    for n in sizes:
+        # Storico che termina a "oggi": l'inizio si sposta all'indietro con la dimensione
+        df = diario_sintetico(n, inizio=(pd.Timestamp(oggi) - pd.Timedelta(days=n // 19)).strftime("%Y-%m-%d"))
+        caldo, piano = pianifica_archivio(df, anno_limite(pd.Timestamp(oggi)))
+        fogli = {"diario": caldo, RIEPILOGO: pd.DataFrame()}
+        for anno, (righe, via) in piano.items():
+            fogli[foglio_anno(anno)] = unisci_partizione(pd.DataFrame(), righe, via)
+        fogli[RIEPILOGO] = pd.concat([riepilogo_giorni(normalizza_diario(p)) for k, p in fogli.items() if k.startswith("diario_")], ignore_index=True)
+        mem_tutto, mem = MemorySheetBackend({"diario": df}), MemorySheetBackend(fogli)
+        t_tutto = _misura(lambda: normalizza_diario(mem_tutto.read("diario")), ripetizioni)
+        t_caldo = _misura(lambda: (normalizza_diario(mem.read("diario")), leggi_riepilogo(mem.read(RIEPILOGO))), ripetizioni)
+        t_anno = _misura(lambda: normalizza_diario(mem.read(foglio_anno(max(piano)))), ripetizioni) if piano else 0.0
+        print(f"{n:>7} | {len(piano):>4} | {t_tutto:>8.1f} | {len(caldo):>11} | {t_caldo:>13.1f} | {t_anno:>9.1f}")
+
+
+def bench_allenamenti(sizes=(10_000, 100_000, 300_000), ripetizioni=5):
+    """Progressi workout: scansione dei JSON ad ogni render vs tabella dei set in cache + aggiornamento incrementale"""
+    print("== Analisi allenamenti (volume settimanale + progressione di un esercizio) ==")
+    print(f"{'righe':>7} | {'esercizi':>8} | {'scansione ms':>12} | {'tabella ms (1 volta)':>20} | {'+1 sessione ms':>14} | {'render ms':>9}")
+    for n in sizes:
+        df = diario_sintetico(n)
+        def scansione():
+            vol, prog = {}, {}
+            a = df[df["tipo"] == "allenamento"]
+            for data, js in zip(a["data"], a["dettaglio_json"]):
+                for e in json.loads(js).get("esercizi", []):
+                    sett = pd.Timestamp(data).to_period("W")
+                    vol[sett, e.get("type")] = vol.get((sett, e.get("type")), 0) + e.get("serie", 0)
+                    if e.get("nome") == "Panca piana": prog[data] = max(prog.get(data, 0), e["kg"] * (1 + e["reps"] / 30))
+            return vol, prog
+        allen = normalizza_diario(df)["allenamenti"]
+        tab = tabella_set(allen)
+        nuova = df[df["tipo"] == "allenamento"].tail(1).assign(id="nuova")
+        t_old = _misura(scansione, ripetizioni)
+        t_tab = _misura(lambda: tabella_set(allen), ripetizioni)
+        t_inc = _misura(lambda: aggiorna_set(tab, nuova), ripetizioni)
+        t_new = _misura(lambda: (volume_settimanale(tab, settimane=12), progressione(tab, "Panca piana")), ripetizioni)
+        print(f"{n:>7} | {len(tab):>8} | {t_old:>12.1f} | {t_tab:>20.1f} | {t_inc:>14.1f} | {t_new:>9.1f}")
+
+
+def bench_pr(sizes=(10_000, 100_000, 300_000), ripetizioni=5):
+    """'Ultima volta / PR' di un esercizio: scansione dei JSON di tutte le sessioni vs indice dei record"""
+    print("== Record personali (esercizio selezionato nel Workout) ==")
+    print(f"{'righe':>7} | {'scansione ms':>12} | {'indice ms (1 volta)':>19} | {'+1 sessione ms':>14} | {'lookup us':>9}")
+    for n in sizes:
+        df = diario_sintetico(n)
+        a = df[df["tipo"] == "allenamento"]
+        def scansione():
+            best, ultimo = 0.0, None
+            for js in a["dettaglio_json"]:
+                for e in json.loads(js).get("esercizi", []):
+                    if e.get("nome") == "Squat" and e.get("type") == "pesi": best, ultimo = max(best, e["kg"]), e
+            return best, ultimo
+        tab = tabella_set(normalizza_diario(df)["allenamenti"])
+        indice = indice_pr(tab)
+        nuova = a.tail(1).assign(id="nuova")
+        t_old = _misura(scansione, ripetizioni)
+        t_ind = _misura(lambda: indice_pr(tab), ripetizioni)
+        t_inc = _misura(lambda: aggiorna_pr(indice, nuova), ripetizioni)
+        t_get = _misura(lambda: indice.get(("Squat", "pesi")), 1000) * 1000
+        print(f"{n:>7} | {t_old:>12.1f} | {t_ind:>19.1f} | {t_inc:>14.1f} | {t_get:>9.2f}")
+
+
+def _picco_mb(fn):
+    tracemalloc.start()
+    try: fn(); return tracemalloc.get_traced_memory()[1] / 2**20
+    finally: tracemalloc.stop()
+
+
+def bench_scambio(sizes=(50_000, 200_000), n_import=2_000, latenza=0.005):
+    """Export pasti: tabella intera + to_csv vs blocchi su file; import: un append per riga vs lotti validati"""
+    print("== Export (picco di memoria oltre al diario grezzo) ==")
+    print(f"{'righe':>7} | {'tutto MB':>8} | {'tutto ms':>8} | {'blocchi MB':>10} | {'blocchi ms':>10} | {'parquet MB':>10}")
+    for n in sizes:
+        df = diario_sintetico(n)
+        def tutto(): return normalizza_diario(df)["pasti"].to_csv()
+        t_all, m_all = _misura(tutto, 1), _picco_mb(tutto)
+        t_blk, m_blk = _misura(lambda: esporta([df], "pasti"), 1), _picco_mb(lambda: esporta([df], "pasti"))
+        m_pq = _picco_mb(lambda: esporta([df], "pasti", "Parquet"))
+        print(f"{n:>7} | {m_all:>8.1f} | {t_all:>8.0f} | {m_blk:>10.1f} | {t_blk:>10.0f} | {m_pq:>10.1f}")
+
+    # Il bottone vero dell'app: il callable passa dalla conversione di Streamlit come al click
+    fogli = fogli_sintetici(sizes[0] // 10)
+    at = _app(fogli); at.run()
+    dati = _download_differito(at, "📤 Esporta", lambda: at.button_group(key="sezione").set_value("📏 Storico").run())
+    atteso = esporta([fogli["diario"]], "pasti", "CSV", eliminati(fogli["diario"]))
+    print(f"📤 Esporta dall'app    : {len(dati) / 1024:.0f} KB, {len(pd.read_csv(io.BytesIO(dati)))} pasti "
+          f"{_verifica(dati == atteso, 'scambio: download export')}")
+
+    print(f"== Import di {n_import} pasti (latenza {latenza * 1000:.0f} ms per scrittura) ==")
+    tabella = normalizza_diario(diario_sintetico(n_import * 2))["pasti"].head(n_import).reset_index()
+    righe, errori = valida_import(tabella.assign(data=tabella["data"].dt.strftime("%Y-%m-%d")), "pasti")
+    mem = MemorySheetBackend({"diario": diario_sintetico(10)}, latenza=latenza)
+    t0 = time.perf_counter()
+    for r in tabella.head(200).to_dict("records"):  # percorso vecchio: add_riga_diario riga per riga
+        mem.append("diario", nuova_riga_diario("pasto", {k: r[k] for k in ["pasto", "nome", "gr", "cal"]}))
+    t_riga = (time.perf_counter() - t0) / 200 * n_import
+    t0 = time.perf_counter()
+    for lotto in lotti(righe): mem.append("diario", lotto)
+    t_lotti = time.perf_counter() - t0
+    print(f"per riga (stimato): {t_riga:.1f} s | a lotti: {t_lotti:.2f} s | righe valide {len(righe)}, scartate {len(errori)}")
+
+
+def bench_colonnare(sizes=(10_000, 50_000, 200_000)):
+    """Diario a tre colonne (CSV + parse JSON) vs cartella colonnare Parquet: dimensione e tempo di lettura"""
+    print("== Formato colonnare (lettura fino alle tabelle normalizzate) ==")
+    print(f"{'righe':>7} | {'CSV KB':>8} | {'CSV ms':>8} | {'parquet KB':>10} | {'parquet ms':>10} | {'scrittura ms':>12}")
+    for n in sizes:
+        df = diario_sintetico(n)
+        with tempfile.TemporaryDirectory() as d:
+            csv, cartella = os.path.join(d, "diario.csv"), os.path.join(d, "colonnare")
+            df.to_csv(csv, index=False)
+            t_csv = _misura(lambda: normalizza_diario(pd.read_csv(csv, dtype=str, keep_default_na=False)), 1)
+            norm = normalizza_diario(df)
+            t_w = _misura(lambda: colonnare.scrivi(norm, cartella), 1)
+            t_pq = _misura(lambda: colonnare.leggi(cartella), 3)
+            print(f"{n:>7} | {colonnare.dimensione(csv) / 1024:>8.0f} | {t_csv:>8.0f} | {colonnare.dimensione(cartella) / 1024:>10.0f} | {t_pq:>10.0f} | {t_w:>12.0f}")
+
+
+def bench_ricerca(n=50_000, ripetizioni=20):
+    """Ricerca cibi: lista completa nel selectbox + filtro lineare vs indice prefissi/trigrammi"""
+    print(f"== Ricerca catalogo ({n} cibi) ==")
+    df = catalogo_sintetico(n)
+    t0 = time.perf_counter(); ix = IndiceCatalogo(df); t_build = (time.perf_counter() - t0) * 1000
+    nome = df["nome"].iloc[n // 2]
+    payload = len(json.dumps(["-- Manuale --"] + df["nome"].tolist()))
+    print(f"payload selectbox completo : {payload / 1024:8.0f} KB  (top-20: {len(json.dumps(ix.cerca('pollo'))) / 1024:.1f} KB)")
+    print(f"tolist() ad ogni rerun     : {_misura(lambda: df['nome'].tolist(), ripetizioni):8.2f} ms")
+    print(f"lookup lineare df==nome    : {_misura(lambda: df[df['nome'] == nome].iloc[0], ripetizioni):8.2f} ms")
+    print(f"lookup hash indice         : {_misura(lambda: ix.get(nome), ripetizioni):8.4f} ms")
+    print(f"costruzione indice (1 volta): {t_build:7.0f} ms")
+    for q in ["pol", "salmone affumicato", "yogrt greco", "cioccolato fondente"]:
+        print(f"cerca {q!r:<22}: {_misura(lambda: ix.cerca(q), ripetizioni):8.2f} ms -> {ix.cerca(q, 3)}")
+
+
+def bench_coach(latenza=0.8):
+    """Coach AI: chiamata sincrona nel render vs worker in background + cache"""
+    print(f"== Coach AI (stub, latenza modello {latenza * 1000:.0f} ms) ==")
+    client = StubClient(latenza=latenza, per_token=0.01)
+    domanda = "Come aumento la panca?"
+    t0 = time.perf_counter(); "".join(client.stream(PROMPT_PT.format(domanda=domanda)))
+    print(f"render bloccato (sincrono) : {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    coach = Coach(client)
+    t0 = time.perf_counter(); r = coach.chiedi(domanda); t_ret = time.perf_counter() - t0
+    while not r.testo: time.sleep(0.001)
+    t_primo = time.perf_counter() - t0
+    while not r.finito: time.sleep(0.001)
+    print(f"render bloccato (worker)   : {t_ret * 1000:8.3f} ms")
+    print(f"primo token                : {t_primo * 1000:8.1f} ms")
+    print(f"risposta completa          : {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    t0 = time.perf_counter(); r2 = coach.chiedi("  come aumento la PANCA ")
+    print(f"domanda ripetuta (cache)   : {(time.perf_counter() - t0) * 1000:8.3f} ms (da cache: {r2.da_cache}, chiamate modello: {client.chiamate})")
+
+
+BENCH = {"scrittura": bench_scrittura, "sync": bench_sync, "concorrenza": bench_concorrenza, "giorno": bench_giorno,
+         "peso": bench_peso, "ricerca": bench_ricerca, "coach": bench_coach, "rerun": bench_rerun, "app": bench_app,
+         "archivio": bench_archivio, "allenamenti": bench_allenamenti, "pr": bench_pr, "scambio": bench_scambio,
+         "colonnare": bench_colonnare, "sessioni": bench_sessioni}
+
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    out = None
+    if "--json" in args:
+        i = args.index("--json"); out = args[i + 1]; del args[i:i + 2]
+    for nome in args or list(BENCH):
+        r = BENCH[nome]()
+        if nome == "app" and out:
+            with open(out, "w") as f: json.dump({"creato": time.strftime("%Y-%m-%d %H:%M:%S"), "app": r}, f, indent=2)
+            print(f"report salvato in {out}")
+    if FALLITI: sys.exit(f"controlli falliti: {', '.join(FALLITI)}")
@@ -0,0 +1,100 @@
+import bisect
+import unicodedata
+from types import MappingProxyType
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 🔍 INDICE DI RICERCA CATALOGHI (cibi / integratori)
+# ==========================================
+def normalizza_nome(s):
+    """minuscolo, senza accenti e spazi doppi ("Caffè  Latte" -> "caffe latte")"""
+    s = str(s).lower()
+    if not s.isascii():
+        s = "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+    return " ".join(s.split())
+
+
+def trigrammi(s):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class IndiceCatalogo:
+    """Indice costruito una volta per generazione della cache del foglio.
+
+    - prefissi: ricerca binaria sui nomi normalizzati ordinati
+    - fuzzy: trigrammi con posting list, similarità di Jaccard vettoriale
+    - get(nome): lookup hash nome -> macro per 100g (o per unità)
+
+    Condiviso da tutte le sessioni: nomi in tupla e macro in sola lettura
+    (in session_state va il riferimento, non una copia).
+    """
+
+    def __init__(self, df):
+        if df.empty or "nome" not in df.columns: df = pd.DataFrame({"nome": []})
+        df = df.dropna(subset=["nome"])
+        df = df.assign(nome=df["nome"].astype(str)).drop_duplicates("nome")  # come prima: vale la prima riga col nome
+        macro = {k: pd.to_numeric(df[col], errors="coerce").fillna(0.0).astype(float) if col in df.columns else pd.Series(0.0, index=df.index)
+                 for k, col in [("k", "kcal"), ("p", "pro"), ("c", "carb"), ("f", "fat")]}
+        self.nomi = tuple(df["nome"].tolist())
+        self.macro = MappingProxyType({n: MappingProxyType({"k": k, "p": p, "c": c, "f": f})
+                                       for n, k, p, c, f in zip(self.nomi, *(macro[x].tolist() for x in "kpcf"))})
+        chiavi = [normalizza_nome(n) for n in self.nomi]
+        self._ordine = sorted(range(len(chiavi)), key=chiavi.__getitem__)
+        self._chiavi_ord = tuple(chiavi[i] for i in self._ordine)
+        # Posting list dei trigrammi costruite in blocco (factorize + argsort)
+        tri = [trigrammi(c) for c in chiavi]
+        self._n_tri = np.fromiter(map(len, tri), dtype=np.int32, count=len(tri))
+        codici, uniche = pd.factorize(pd.Series([t for ts in tri for t in ts], dtype=object))
+        ids = np.repeat(np.arange(len(tri), dtype=np.int32), self._n_tri)
+        ordine = np.argsort(codici, kind="stable")
+        tagli = np.cumsum(np.bincount(codici, minlength=len(uniche)))[:-1]
+        self._post = dict(zip(uniche, np.split(ids[ordine], tagli)))
+
+    def __len__(self): return len(self.nomi)
+
+    def get(self, nome):
+        return self.macro.get(nome)
+
+    def _prefisso(self, q, k):
+        i = bisect.bisect_left(self._chiavi_ord, q)
+        out = []
+        while i < len(self._chiavi_ord) and len(out) < k and self._chiavi_ord[i].startswith(q):
+            out.append(self._ordine[i]); i += 1
+        return out
+
+    def cerca(self, q, k=20, soglia=0.2):
+        """Top-k nomi per la query: prima i prefissi, poi i più simili per trigrammi"""
+        q = normalizza_nome(q)
+        if not q: return [self.nomi[i] for i in self._ordine[:k]]
+        scelti = self._prefisso(q, k)
+        if len(scelti) < k:
+            tri_q = trigrammi(q)
+            liste = [self._post[t] for t in tri_q if t in self._post]
+            if liste:
+                comuni = np.bincount(np.concatenate(liste), minlength=len(self.nomi))
+                cand = np.flatnonzero(comuni)
+                jacc = comuni[cand] / (len(tri_q) + self._n_tri[cand] - comuni[cand])
+                ok = jacc >= soglia
+                cand, jacc = cand[ok], jacc[ok]
+                m = min(len(cand), k + len(scelti))
+                top = cand[np.argsort(-jacc, kind="stable")[:m]] if m else []
+                gia = set(scelti)
+                scelti += [int(i) for i in top if int(i) not in gia][:k - len(scelti)]
+        return [self.nomi[i] for i in scelti]
+
+
+# ==========================================
+# 🏋️ CATALOGO ESERCIZI
+# ==========================================
+CATEGORIE_ESERCIZI = ["Pesi", "Calisthenics", "Isometria", "Abs"]
+
+
+def esercizi_per_categoria(df):
+    """Foglio esercizi -> {categoria: tupla di nomi ordinati} (senza colonna categoria: tutti Pesi)"""
+    if df.empty or "nome" not in df.columns: df = pd.DataFrame(columns=["nome", "categoria"])
+    elif "categoria" not in df.columns: df = df.assign(categoria="Pesi")
+    nomi = df.dropna(subset=["nome"])
+    return MappingProxyType({c: tuple(sorted(nomi.loc[nomi["categoria"] == c, "nome"].astype(str).unique()))
+                             for c in CATEGORIE_ESERCIZI})
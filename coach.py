@@ -0,0 +1,114 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================
+# 🤖 COACH AI (fuori dal render path)
+# ==========================================
+PROMPT_PT = "Sei un PT esperto. Sii breve e motivante. Rispondi: {domanda}"
+
+
+def normalizza_prompt(s):
+    """Chiave di cache: minuscolo, spazi compattati, senza punteggiatura finale"""
+    return re.sub(r"\s+", " ", str(s).lower()).strip().rstrip("?!. ")
+
+
+class RispostaCache:
+    """Cache LRU con scadenza (TTL) delle risposte complete"""
+
+    def __init__(self, max_voci=256, ttl=24 * 3600):
+        self.max_voci = max_voci
+        self.ttl = ttl
+        self._voci = OrderedDict()  # chiave -> (ts, testo)
+        self._lock = threading.Lock()
+
+    def get(self, chiave):
+        with self._lock:
+            v = self._voci.get(chiave)
+            if v is None: return None
+            if time.monotonic() - v[0] > self.ttl:
+                del self._voci[chiave]; return None
+            self._voci.move_to_end(chiave)
+            return v[1]
+
+    def put(self, chiave, testo):
+        with self._lock:
+            self._voci[chiave] = (time.monotonic(), testo)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.max_voci: self._voci.popitem(last=False)
+
+
+class GeminiClient:
+    """Client reale: stream dei chunk di generate_content"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+class StubClient:
+    """Client finto per test e benchmark: risposta fissa, token a intervalli regolari"""
+
+    def __init__(self, risposta="Ottimo lavoro! Continua così, un passo alla volta.", latenza=0.5, per_token=0.02):
+        self.risposta = risposta
+        self.latenza = latenza      # attesa prima del primo token
+        self.per_token = per_token
+        self.chiamate = 0
+
+    def stream(self, prompt):
+        self.chiamate += 1
+        time.sleep(self.latenza)
+        for parola in self.risposta.split(" "):
+            time.sleep(self.per_token)
+            yield parola + " "
+
+
+class RispostaCoach:
+    """Risposta in corso: il worker accoda il testo, la UI lo legge a ogni refresh"""
+
+    def __init__(self, domanda):
+        self.domanda = domanda
+        self.testo = ""
+        self.finito = False
+        self.errore = None
+        self.da_cache = False
+        self.t_inizio = time.perf_counter()
+        self.t_primo = None  # primo token (per il profiling)
+        self.t_fine = None
+
+
+class Coach:
+    """Worker condiviso dal processo: chiamate al modello in thread, cache sulle domande"""
+
+    def __init__(self, client, cache=None, workers=2):
+        self.client = client
+        self.cache = cache or RispostaCache()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coach")
+
+    def chiedi(self, domanda):
+        r = RispostaCoach(domanda)
+        chiave = normalizza_prompt(domanda)
+        testo = self.cache.get(chiave)
+        if testo is not None:
+            r.testo, r.finito, r.da_cache = testo, True, True
+            r.t_primo = r.t_fine = time.perf_counter()
+            return r
+        self._pool.submit(self._esegui, r, chiave)
+        return r
+
+    def _esegui(self, r, chiave):
+        try:
+            for pezzo in self.client.stream(PROMPT_PT.format(domanda=r.domanda)):
+                if r.t_primo is None: r.t_primo = time.perf_counter()
+                r.testo += pezzo
+            self.cache.put(chiave, r.testo)
+        except Exception as e:
+            r.errore = e
+        finally:
+            r.t_fine = time.perf_counter()
+            r.finito = True
@@ -0,0 +1,163 @@
+"""Formato colonnare del diario su disco: un file Parquet per tabella + manifest versionato.
+
+Uso:  python colonnare.py <diario.csv | store.db> <cartella>
+
+Migra il diario a tre colonne (data/tipo/dettaglio_json, da CSV del foglio o dallo store
+SQLite locale) nel formato colonnare e stampa dimensioni e tempi di lettura a confronto.
+"""
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from diario import SCHEMA, TABELLE, normalizza_diario
+
+# ==========================================
+# 🧱 FORMATO COLONNARE (Parquet per tabella)
+# ==========================================
+FORMATO = "fitness-diario-colonnare"
+VERSIONE = 1
+MANIFEST = "manifest.json"
+# Campi di un esercizio: interi se nel file lo sono tutti (come li scrive l'app), altrimenti float
+CAMPI_ESERCIZIO = {"type": str, "nome": str, "serie": int, "reps": int, "kg": float, "tempo": int, "km": float, "kcal": int}
+MIGRAZIONI = {}  # versione -> fn(cartella, manifest) che porta il formato alla versione successiva
+_DATA = pd.to_datetime(pd.Series(["2020-01-01"])).dtype  # stessa risoluzione di normalizza_diario
+
+
+def _numero(v):
+    try: return None if v is None or v == "" or (isinstance(v, float) and np.isnan(v)) else float(v)
+    except (TypeError, ValueError): return None
+
+
+def _tipo_esercizio(esercizi):
+    """Struct Arrow degli esercizi: i campi 'int' restano interi solo se tutti i valori sono interi"""
+    import pyarrow as pa
+    campi = []
+    for k, t in CAMPI_ESERCIZIO.items():
+        if t is int:
+            interi = all(float(x).is_integer() for e in esercizi if (x := _numero(e.get(k))) is not None)
+            campi.append((k, pa.int64() if interi else pa.float64()))
+        else: campi.append((k, pa.string() if t is str else pa.float64()))
+    return pa.struct(campi)
+
+
+def _esercizi_arrow(liste):
+    """Liste di dict (JSON libero) -> list<struct> tipizzata; chiavi fuori da CAMPI_ESERCIZIO scartate"""
+    import pyarrow as pa
+    tutti = [e for lst in liste for e in lst if isinstance(e, dict)]
+    tipo = _tipo_esercizio(tutti)
+    interi = {f.name for f in tipo if pa.types.is_integer(f.type)}
+    def pulito(e):
+        out = {}
+        for k, t in CAMPI_ESERCIZIO.items():
+            v = e.get(k)
+            if t is str: out[k] = None if v is None else str(v)
+            else:
+                x = _numero(v)
+                out[k] = None if x is None else int(x) if k in interi else x
+        return out
+    return pa.array([[pulito(e) for e in lst if isinstance(e, dict)] for lst in liste], type=pa.list_(tipo))
+
+
+def _tabella_arrow(t, nome):
+    """Tabella normalizzata -> pyarrow.Table con colonne e tipi da SCHEMA (settings: testo)"""
+    import pyarrow as pa
+    t = t.reset_index()
+    cols = {"id": pa.array(t["id"].astype(str), pa.string()), "data": pa.array(t["data"], pa.timestamp("us"))}
+    schema = SCHEMA[nome] or {c: "" for c in t.columns if c not in ("id", "data")}
+    for col, default in schema.items():
+        v = t[col] if col in t.columns else pd.Series(np.nan, index=t.index)
+        if default is list: cols[col] = _esercizi_arrow(v)
+        elif isinstance(default, str): cols[col] = pa.array([None if pd.isna(x) else str(x) for x in v], pa.string())
+        else:
+            x = pd.to_numeric(v, errors="coerce")  # interi restano interi (come li lascia normalizza_diario)
+            cols[col] = pa.array(x, pa.int64() if pd.api.types.is_integer_dtype(x) else pa.float64())
+    return pa.table(cols)
+
+
+def scrivi(norm, cartella, meta=None):
+    """Tabelle normalizzate -> cartella con <tabella>.parquet + manifest (versione, righe, meta)"""
+    import pyarrow.parquet as pq
+    os.makedirs(cartella, exist_ok=True)
+    righe = {}
+    for nome in TABELLE.values():
+        pq.write_table(_tabella_arrow(norm[nome], nome), os.path.join(cartella, f"{nome}.parquet"), compression="zstd")
+        righe[nome] = len(norm[nome])
+    # Manifest per ultimo: una cartella senza manifest (scrittura interrotta) non viene letta
+    with open(os.path.join(cartella, MANIFEST), "w") as f:
+        json.dump({"formato": FORMATO, "versione": VERSIONE, "creato": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "righe": righe, "meta": meta or {}}, f, indent=2)
+
+
+def manifest(cartella):
+    """Manifest della cartella (None se manca o non è questo formato)"""
+    try:
+        with open(os.path.join(cartella, MANIFEST)) as f: m = json.load(f)
+    except (OSError, ValueError): return None
+    return m if m.get("formato") == FORMATO else None
+
+
+def _esercizi_pandas(col):
+    # list<struct> -> liste di dict come nel JSON originale (senza i campi mancanti)
+    return [[{k: v for k, v in e.items() if v is not None} for e in lst] for lst in col.to_pylist()]
+
+
+def leggi(cartella):
+    """Cartella colonnare -> stesse tabelle di normalizza_diario (indice id, ordinate per data)"""
+    import pyarrow.parquet as pq
+    m = manifest(cartella)
+    if m is None: raise FileNotFoundError(f"nessun diario colonnare in {cartella}")
+    while m["versione"] < VERSIONE: m = MIGRAZIONI[m["versione"]](cartella, m)
+    if m["versione"] > VERSIONE: raise ValueError(f"formato versione {m['versione']} più recente di questa app ({VERSIONE})")
+    norm = {}
+    for nome in TABELLE.values():
+        tab = pq.read_table(os.path.join(cartella, f"{nome}.parquet"))
+        esercizi = _esercizi_pandas(tab.column("esercizi")) if "esercizi" in tab.column_names else None
+        if esercizi is not None: tab = tab.drop_columns(["esercizi"])
+        t = tab.to_pandas()  # colonne numeriche senza copia riga per riga, niente JSON da parsare
+        if esercizi is not None: t["esercizi"] = esercizi
+        t["data"] = t["data"].astype(_DATA)
+        if SCHEMA[nome]: t = t[["id", "data"] + list(SCHEMA[nome])]
+        norm[nome] = t.set_index("id").sort_values("data", kind="stable")
+    return norm
+
+
+def migra(df, cartella, meta=None):
+    """Diario a tre colonne (data/tipo/dettaglio_json[/id]) -> formato colonnare. Restituisce le righe per tabella"""
+    norm = normalizza_diario(df)
+    scrivi(norm, cartella, meta)
+    return {k: len(v) for k, v in norm.items()}
+
+
+def a_righe(norm):
+    """Formato colonnare -> diario a tre colonne (per tornare indietro o verificare la migrazione)"""
+    tipi = {nome: tipo for tipo, nome in TABELLE.items()}
+    out = []
+    for nome, t in norm.items():
+        for id_, r in zip(t.index, t.drop(columns="data").to_dict("records")):
+            dati = {k: v for k, v in r.items() if not (v is None or (isinstance(v, float) and np.isnan(v)))}
+            out.append((t.at[id_, "data"], tipi[nome], json.dumps(dati), id_))
+    df = pd.DataFrame(out, columns=["data", "tipo", "dettaglio_json", "id"]).sort_values("data", kind="stable")
+    return df.assign(data=df["data"].dt.strftime("%Y-%m-%d")).reset_index(drop=True)
+
+
+def dimensione(percorso):
+    """Byte su disco di un file o di una cartella"""
+    if os.path.isfile(percorso): return os.path.getsize(percorso)
+    return sum(os.path.getsize(os.path.join(percorso, f)) for f in os.listdir(percorso))
+
+
+if __name__ == "__main__":
+    import sys
+    from db_engine import SQLiteBackend
+    sorgente, cartella = sys.argv[1], sys.argv[2]
+    t0 = time.perf_counter()
+    df = SQLiteBackend(sorgente).read("diario") if sorgente.endswith(".db") else pd.read_csv(sorgente, dtype=str, keep_default_na=False)
+    norm = normalizza_diario(df)
+    t_vecchio = time.perf_counter() - t0
+    scrivi(norm, cartella, {"sorgente": os.path.basename(sorgente)})
+    t0 = time.perf_counter(); leggi(cartella); t_nuovo = time.perf_counter() - t0
+    print(f"righe: {len(df)} -> " + ", ".join(f"{k} {len(v)}" for k, v in norm.items()))
+    print(f"dimensione: {dimensione(sorgente) / 2**20:.1f} MB -> {dimensione(cartella) / 2**20:.1f} MB")
+    print(f"lettura + normalizzazione: {t_vecchio * 1000:.0f} ms -> lettura colonnare: {t_nuovo * 1000:.0f} ms")
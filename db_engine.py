@@ -0,0 +1,613 @@
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import datetime
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+# I frame in cache sono condivisi da tutte le sessioni: con copy-on-write (sempre attivo da
+# pandas 3) un frame derivato non può modificare quello condiviso
+if int(pd.__version__.split(".")[0]) < 3: pd.set_option("mode.copy_on_write", True)
+
+# ==========================================
+# 🚀 STORAGE LAYER (backend dei fogli)
+# ==========================================
+DIARIO_COLS = ["data", "tipo", "dettaglio_json", "id"]
+
+
+def _cella(v):
+    """Converte un valore pandas/numpy in una cella serializzabile"""
+    if v is None: return ""
+    try:
+        if pd.isna(v): return ""
+    except (TypeError, ValueError): pass
+    return v.item() if hasattr(v, "item") else v
+
+
+def to_values(df):
+    """Serializza il DataFrame in righe di celle (stesso formato inviato a gspread)"""
+    return [[_cella(v) for v in row] for row in df.itertuples(index=False, name=None)]
+
+
+def nuova_riga_diario(tipo, dati, data_custom=None):
+    """Costruisce la riga del diario (una sola) pronta per l'append"""
+    target_date = data_custom if data_custom else datetime.datetime.now().strftime("%Y-%m-%d")
+    return pd.DataFrame([{"data": target_date, "tipo": tipo, "dettaglio_json": json.dumps(dati), "id": nuovo_id()}])
+
+
+def nuovo_id():
+    """ID persistente di una riga del diario (non dipende dalla posizione nel foglio).
+
+    Prefisso "r" (come "h" degli ID storici): il foglio non lo legge mai come numero
+    (es. "012345678901" -> 12345678901, "123456789e12" -> float)."""
+    return "r" + uuid.uuid4().hex[:11]
+
+
+def apri_spreadsheet(cfg):
+    """Spreadsheet gspread dai secrets della connessione (service account + "spreadsheet": URL o nome)"""
+    import gspread
+    cfg = dict(cfg)
+    nome = cfg.pop("spreadsheet")
+    for k in ("type", "worksheet"): cfg.pop(k, None)
+    client = gspread.service_account_from_dict(cfg)
+    return client.open_by_url(nome) if str(nome).startswith("http") else client.open(nome)
+
+
+class GSheetsBackend:
+    """Backend remoto: worksheet Google Sheets via st-gsheets-connection.
+
+    Letture e riscritture passano dalla connessione; gli append dal worksheet gspread,
+    aperto con l'API pubblica dallo spreadsheet restituito da apri() (una volta sola).
+    """
+
+    def __init__(self, conn, apri):
+        self.conn = conn
+        self.apri = apri
+        self._file = None
+        self._lock = threading.Lock()
+
+    def worksheet(self, sheet):
+        with self._lock:
+            if self._file is None: self._file = self.apri()
+        return self._file.worksheet(sheet)
+
+    def read(self, sheet):
+        # ttl=0: niente cache interna della connessione, la cache è SheetCache
+        try:
+            return self.conn.read(worksheet=sheet, ttl=0)
+        except Exception as e:
+            # Foglio che non esiste ancora: vuoto (come gli altri backend); ogni altro errore risale
+            if type(e).__name__ != "WorksheetNotFound": raise
+            return pd.DataFrame()
+
+    def update(self, sheet, df):
+        # Riscrittura completa del foglio (clear + set_with_dataframe)
+        try:
+            self.conn.update(worksheet=sheet, data=df)
+        except Exception as e:
+            if type(e).__name__ != "WorksheetNotFound": raise
+            self.conn.create(worksheet=sheet, data=df)  # primo salvataggio di un foglio nuovo
+
+    def append(self, sheet, df_new):
+        # Invia solo le righe nuove: il costo non dipende dalla lunghezza del foglio
+        self.worksheet(sheet).append_rows(to_values(df_new), value_input_option="USER_ENTERED")
+
+
+class MemorySheetBackend:
+    """Finto foglio in memoria: stessa interfaccia del backend GSheets, senza rete"""
+
+    def __init__(self, sheets=None, latenza=0.0):
+        self.sheets = {}  # nome -> (header, righe)
+        self.celle_inviate = 0
+        self.latenza = latenza  # secondi simulati per round-trip
+        for nome, df in (sheets or {}).items():
+            self.update(nome, df)
+
+    def _rete(self):
+        if self.latenza: time.sleep(self.latenza)
+
+    def read(self, sheet):
+        self._rete()
+        if sheet not in self.sheets: return pd.DataFrame()
+        header, rows = self.sheets[sheet]
+        return pd.DataFrame(rows, columns=header)
+
+    def update(self, sheet, df):
+        self._rete()
+        rows = to_values(df)
+        self.sheets[sheet] = (list(df.columns), rows)
+        self.celle_inviate += len(rows) * len(df.columns)
+
+    def append(self, sheet, df_new):
+        self._rete()
+        header, rows = self.sheets.setdefault(sheet, (list(df_new.columns), []))
+        nuove = to_values(df_new.reindex(columns=header))
+        rows.extend(nuove)
+        self.celle_inviate += len(nuove) * len(header)
+
+
+# ==========================================
+# 💾 STORE LOCALE (SQLite) + SYNC ASINCRONO
+# ==========================================
+def _norm_cella(v):
+    v = _cella(v)
+    if isinstance(v, float) and v.is_integer(): v = int(v)
+    return str(v)
+
+
+def chiavi_righe(df):
+    """Chiave testuale per riga, indipendente dai dtype (locale vs foglio)"""
+    return [json.dumps([_norm_cella(v) for v in row]) for row in df.itertuples(index=False, name=None)]
+
+
+def fingerprint(df, chiavi=None):
+    h = hashlib.sha1()
+    chiavi = chiavi_righe(df) if chiavi is None else chiavi
+    for k in chiavi: h.update(k.encode())
+    return len(chiavi), h.hexdigest()
+
+
+def _hash_chiave(k): return hashlib.sha1(k.encode()).hexdigest()[:16]
+
+
+class SQLiteBackend:
+    """Store locale su file SQLite: una tabella per foglio + outbox delle scritture"""
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS _outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, sheet TEXT, op TEXT, payload TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS _sync_meta (sheet TEXT PRIMARY KEY, n INTEGER, h TEXT)")
+            # Righe (hash della chiave) dell'ultimo stato sincronizzato: distingue le righe altrui da quelle tolte in locale
+            self._db.execute("CREATE TABLE IF NOT EXISTS _sync_righe (sheet TEXT, k TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS _sync_righe_sheet ON _sync_righe (sheet)")
+
+    @staticmethod
+    def _tab(sheet): return f"sheet_{sheet}"
+
+    def has(self, sheet):
+        with self.lock:
+            q = "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?"
+            return self._db.execute(q, (self._tab(sheet),)).fetchone() is not None
+
+    def sheets(self):
+        with self.lock:
+            q = "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'sheet\\_%' ESCAPE '\\'"
+            return [r[0][len("sheet_"):] for r in self._db.execute(q).fetchall()]
+
+    def read(self, sheet):
+        with self.lock:
+            if not self.has(sheet): return pd.DataFrame()
+            return pd.read_sql(f'SELECT * FROM "{self._tab(sheet)}"', self._db)
+
+    @staticmethod
+    def _pulisci(df):
+        # "" (fillna del foglio) -> NULL, così le colonne numeriche restano REAL
+        return df.mask(df.astype(object).eq("")).infer_objects()
+
+    def update(self, sheet, df):
+        with self.lock:
+            if len(df.columns) == 0:
+                with self._db: self._db.execute(f'DROP TABLE IF EXISTS "{self._tab(sheet)}"')
+                return
+            self._pulisci(df).to_sql(self._tab(sheet), self._db, if_exists="replace", index=False)
+
+    def append(self, sheet, df_new):
+        with self.lock:
+            if not self.has(sheet): return self.update(sheet, df_new)
+            self._pulisci(df_new).to_sql(self._tab(sheet), self._db, if_exists="append", index=False)
+
+    # --- outbox / metadati di sync ---
+    def enqueue(self, sheet, op, payload=""):
+        with self.lock, self._db:
+            self._db.execute("INSERT INTO _outbox (sheet, op, payload) VALUES (?, ?, ?)", (sheet, op, payload))
+
+    def outbox(self):
+        with self.lock:
+            return self._db.execute("SELECT id, sheet, op, payload FROM _outbox ORDER BY id").fetchall()
+
+    def ack(self, ids):
+        with self.lock, self._db:
+            self._db.executemany("DELETE FROM _outbox WHERE id = ?", [(i,) for i in ids])
+
+    def get_meta(self, sheet):
+        with self.lock:
+            r = self._db.execute("SELECT n, h FROM _sync_meta WHERE sheet = ?", (sheet,)).fetchone()
+            return r if r else (None, None)
+
+    def set_meta(self, sheet, fp, chiavi=None):
+        with self.lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO _sync_meta (sheet, n, h) VALUES (?, ?, ?)", (sheet, fp[0], fp[1]))
+            if chiavi is not None:
+                self._db.execute("DELETE FROM _sync_righe WHERE sheet = ?", (sheet,))
+                self._db.executemany("INSERT INTO _sync_righe (sheet, k) VALUES (?, ?)", [(sheet, _hash_chiave(k)) for k in chiavi])
+
+    def righe_sincronizzate(self, sheet):
+        """Counter hash -> n delle righe all'ultimo sync (vuoto se non registrate, es. store vecchio)"""
+        with self.lock:
+            return Counter(r[0] for r in self._db.execute("SELECT k FROM _sync_righe WHERE sheet = ?", (sheet,)))
+
+
+class SyncedBackend:
+    """Write-through locale: letture e scritture su SQLite, sync verso il foglio in background.
+
+    Le scritture finiscono nell'outbox (persistente) e vengono inviate a lotti:
+    gli append come un solo append, le riscritture come un solo update.
+    Prima di inviare si confronta il foglio con l'ultimo stato sincronizzato:
+    le righe aggiunte da altri nel frattempo vengono fuse in locale, mai perse, mentre
+    quelle tolte in locale dopo l'ultimo sync (registrate in _sync_righe) non tornano.
+    """
+
+    def __init__(self, local, remote, intervallo=30.0, ritardo=2.0):
+        self.local = local
+        self.remote = remote
+        self.intervallo = intervallo  # sync periodico (s)
+        self.ritardo = ritardo        # attesa dopo una scrittura, per raggruppare
+        self.ultimo_errore = None
+        self.on_change = None  # callback(sheet) quando il sync porta righe altrui
+        self._evento = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    # --- interfaccia backend ---
+    def read(self, sheet):
+        if not self.local.has(sheet): self.pull(sheet)
+        return self.local.read(sheet)
+
+    def update(self, sheet, df):
+        with self.local.lock:
+            self.local.update(sheet, df)
+            self.local.enqueue(sheet, "update")
+        self._evento.set()
+
+    def append(self, sheet, df_new):
+        payload = json.dumps({"columns": list(df_new.columns), "rows": to_values(df_new)})
+        with self.local.lock:
+            self.local.append(sheet, df_new)
+            self.local.enqueue(sheet, "append", payload)
+        self._evento.set()
+
+    def pending(self):
+        return len(self.local.outbox())
+
+    # --- sync ---
+    def _segna(self, sheet, df):
+        # Ultimo stato sincronizzato: fingerprint + righe
+        chiavi = chiavi_righe(df)
+        self.local.set_meta(sheet, fingerprint(df, chiavi), chiavi)
+
+    def pull(self, sheet):
+        df = self.remote.read(sheet)
+        with self.local.lock:
+            self.local.update(sheet, df)
+            self._segna(sheet, df)
+
+    def _righe_altrui(self, sheet, remote_df):
+        n, h = self.local.get_meta(sheet)
+        if n is not None and len(remote_df) >= n and fingerprint(remote_df.iloc[:n]) == (n, h):
+            return remote_df.iloc[n:]  # il foglio ha solo ricevuto append
+        # Foglio riscritto da altri: tieni le righe che in locale non esistono,
+        # tranne quelle che c'erano all'ultimo sync (tolte in locale: non vanno resuscitate)
+        local_df = self.local.read(sheet).reindex(columns=remote_df.columns)
+        conta = Counter(chiavi_righe(local_df))
+        sync = self.local.righe_sincronizzate(sheet)
+        keep = []
+        for i, k in enumerate(chiavi_righe(remote_df)):
+            h = _hash_chiave(k)
+            if conta[k] > 0:
+                conta[k] -= 1
+                if sync[h] > 0: sync[h] -= 1
+            elif sync[h] > 0: sync[h] -= 1
+            else: keep.append(i)
+        return remote_df.iloc[keep]
+
+    def _fondi_altrui(self, sheet, remote_df):
+        extra = self._righe_altrui(sheet, remote_df)
+        if len(extra):
+            self.local.append(sheet, extra)
+            if self.on_change: self.on_change(sheet)
+
+    def refresh(self, sheet):
+        """Porta in locale le righe scritte da altri (nessuna scrittura in sospeso)"""
+        remote_df = self.remote.read(sheet)
+        if not len(remote_df.columns): return
+        with self._flush_lock:
+            self._fondi_altrui(sheet, remote_df)
+            self._segna(sheet, remote_df)
+
+    def _sync_sheet(self, sheet, ops):
+        remote_df = self.remote.read(sheet)
+        if len(remote_df.columns): self._fondi_altrui(sheet, remote_df)
+        if any(op == "update" for _, _, op, _ in ops) or len(remote_df.columns) == 0:
+            # Lo snapshot copre anche le scritture arrivate nel frattempo
+            with self.local.lock:
+                snap = self.local.read(sheet)
+                coperte = [o[0] for o in self.local.outbox() if o[1] == sheet]
+            self.remote.update(sheet, snap.fillna(""))
+            self._segna(sheet, snap)
+            return coperte
+        frames = []
+        for _, _, _, payload in ops:
+            p = json.loads(payload)
+            frames.append(pd.DataFrame(p["rows"], columns=p["columns"]))
+        batch = pd.concat(frames, ignore_index=True).reindex(columns=remote_df.columns)
+        self.remote.append(sheet, batch.fillna(""))
+        self._segna(sheet, pd.concat([remote_df, batch], ignore_index=True))
+        return [o[0] for o in ops]
+
+    def flush(self):
+        """Invia l'outbox al foglio; ritorna il numero di operazioni sincronizzate"""
+        with self._flush_lock:
+            ops = self.local.outbox()
+            fatte = 0
+            for sheet in dict.fromkeys(o[1] for o in ops):
+                sheet_ops = [o for o in ops if o[1] == sheet]
+                try:
+                    coperte = self._sync_sheet(sheet, sheet_ops)
+                except Exception as e:
+                    self.ultimo_errore = e  # resta in outbox, si riprova al prossimo giro
+                    continue
+                self.local.ack(coperte)
+                fatte += len(coperte)
+            return fatte
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sheet-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set(); self._evento.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            scrittura = self._evento.wait(self.intervallo)
+            if scrittura: time.sleep(self.ritardo)
+            self._evento.clear()
+            if self._stop.is_set(): break
+            self.flush()
+            if not scrittura:
+                # Giro periodico: allinea i fogli senza scritture in sospeso
+                in_sospeso = {o[1] for o in self.local.outbox()}
+                for sheet in self.local.sheets():
+                    if sheet in in_sospeso: continue
+                    try: self.refresh(sheet)
+                    except Exception as e: self.ultimo_errore = e
+
+
+# ==========================================
+# ✍️ CODA DI SCRITTURA (UI ottimistica)
+# ==========================================
+class ConflittoScrittura(Exception):
+    """Il foglio continua a cambiare durante la riscrittura: tentativi esauriti"""
+
+
+def fondi_tre_vie(base, mio, remoto):
+    """Riscrittura "mio" (derivata da "base") fusa con le modifiche altrui presenti in "remoto".
+
+    Confronto per multiset di righe sulle colonne di base: le righe tolte da altri
+    (in base ma non in remoto) spariscono anche da mio, quelle aggiunte da altri
+    (in remoto ma non in base) vengono aggiunte in coda.
+    """
+    cols = [c for c in base.columns if c in remoto.columns]
+    k_base, k_rem = chiavi_righe(base[cols]), chiavi_righe(remoto[cols])
+    altrui = Counter(k_rem); altrui.subtract(Counter(k_base))
+    tolte = Counter({k: -n for k, n in altrui.items() if n < 0})
+    keep = []
+    for i, k in enumerate(chiavi_righe(mio.reindex(columns=cols))):
+        if tolte[k] > 0: tolte[k] -= 1
+        else: keep.append(i)
+    aggiunte = []
+    for i, k in enumerate(k_rem):
+        if altrui[k] > 0: altrui[k] -= 1; aggiunte.append(i)
+    return pd.concat([mio.iloc[keep], remoto.iloc[aggiunte].reindex(columns=mio.columns)], ignore_index=True)
+
+
+class CodaScritture:
+    """Scritture verso il backend in background, serializzate per foglio.
+
+    Una coda (un thread) per worksheet, condivisa da tutte le sessioni del server:
+    due sessioni non scrivono mai lo stesso foglio in contemporanea. La UI aggiorna
+    subito la cache e non aspetta la rete; un errore viene registrato (e il foglio
+    invalidato tramite on_errore) per il run successivo.
+
+    - append: solo righe nuove, ritentato se fallisce (senza duplicare righe già arrivate)
+    - update con base: controllo di versione (fingerprint) prima di scrivere; se il
+      foglio è cambiato le modifiche altrui vengono fuse e si ritenta (on_change).
+      Senza base il foglio deve essere vuoto, altrimenti le sue righe vengono fuse
+    """
+
+    def __init__(self, backend, tentativi=3, attesa=0.5):
+        self.backend = backend
+        self.tentativi = tentativi
+        self.attesa = attesa  # backoff: attesa, 2*attesa, ...
+        self.errori = deque()
+        self.on_errore = None
+        self.on_change = None
+        self.conflitti = 0
+        self._code = {}  # foglio -> executor a un thread
+        self._in_corso = Counter()  # foglio -> scritture non ancora finite
+        self._cv = threading.Condition()
+
+    def _coda(self, sheet):
+        with self._cv:
+            if sheet not in self._code:
+                self._code[sheet] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"scritture-{sheet}")
+            self._in_corso[sheet] += 1
+            return self._code[sheet]
+
+    def update(self, sheet, df, base=None): self._coda(sheet).submit(self._esegui, self._riscrivi, sheet, df, base)
+
+    def append(self, sheet, df_new): self._coda(sheet).submit(self._esegui, self._aggiungi, sheet, df_new)
+
+    def _esegui(self, fn, sheet, *args):
+        try:
+            fn(sheet, *args)
+        except Exception as e:
+            self.errori.append((sheet, e))
+            if self.on_errore: self.on_errore(sheet)
+        finally:
+            with self._cv:
+                self._in_corso[sheet] -= 1
+                self._cv.notify_all()
+
+    def _aggiungi(self, sheet, df_new):
+        for i in range(self.tentativi):
+            try:
+                return self.backend.append(sheet, df_new)
+            except Exception:
+                if i == self.tentativi - 1: raise
+                time.sleep(self.attesa * 2 ** i)
+                # L'append potrebbe essere arrivato prima dell'errore: non ripeterlo
+                remoto = self.backend.read(sheet)
+                coda = remoto.iloc[len(remoto) - len(df_new):] if len(remoto) >= len(df_new) else remoto.iloc[:0]
+                if chiavi_righe(coda.reindex(columns=df_new.columns)) == chiavi_righe(df_new): return
+
+    def _riscrivi(self, sheet, df, base):
+        # Senza base chi scrive si aspetta un foglio vuoto o nuovo: righe trovate sul foglio vengono fuse, mai sovrascritte
+        if base is None: base = pd.DataFrame(columns=df.columns)
+        for _ in range(self.tentativi):
+            remoto = self.backend.read(sheet)
+            if not len(remoto.columns) or fingerprint(remoto.reindex(columns=base.columns)) == fingerprint(base):
+                return self.backend.update(sheet, df)
+            # Il foglio è cambiato dopo la lettura della sessione: fondi e ricontrolla
+            self.conflitti += 1
+            df, base = fondi_tre_vie(base, df, remoto), remoto
+            if self.on_change: self.on_change(sheet)
+        raise ConflittoScrittura(sheet)
+
+    def attendi(self, sheet=None, timeout=None):
+        """Blocca finché la coda del foglio è vuota (prima di rileggerlo), o tutte se sheet è None (nei test)"""
+        with self._cv:
+            if sheet is not None: return self._cv.wait_for(lambda: self._in_corso[sheet] == 0, timeout)
+            return self._cv.wait_for(lambda: not any(self._in_corso.values()), timeout)
+
+
+# ==========================================
+# 🧠 CACHE PER WORKSHEET (versionata)
+# ==========================================
+class SheetCache:
+    """Cache condivisa per foglio: una scrittura tocca solo il foglio scritto.
+
+    Una sola copia per processo di fogli e derivati, letta da tutte le sessioni: chi li usa
+    non li modifica sul posto (li aggiornano solo set/patch_* e gli incr dei derivati).
+    """
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._entries = {}  # nome -> {"df", "ver", "ts"}
+        self._lock = threading.Lock()
+        self._seq = 0  # contatore globale: una versione non si ripete mai
+        self._scritture = Counter()  # foglio -> scritture/invalidazioni (None = tutti i fogli)
+        self.hits = 0
+        self.misses = 0
+        self.conteggi = Counter()  # (voce, "hit"/"miss"), voce = foglio o "foglio:derivato"
+
+    def _valida(self, e):
+        return e is not None and time.monotonic() - e["ts"] < self.ttl
+
+    def get(self, sheet, loader, rigorosa=False):
+        """Foglio dalla cache o dal loader. Lettura fallita: niente in cache (si riprova al
+        prossimo accesso); l'errore risale se rigorosa, altrimenti frame vuoto solo per chi legge.
+        Se durante la lettura qualcuno scrive il foglio, il frame letto non va in cache (può non
+        avere quella scrittura): lo usa solo chi l'ha letto, il prossimo accesso rilegge."""
+        e = self._entries.get(sheet)
+        if self._valida(e):
+            self.hits += 1; self.conteggi[sheet, "hit"] += 1
+            return e["df"]
+        self.misses += 1; self.conteggi[sheet, "miss"] += 1
+        prima = self._versione_scritture(sheet)
+        try:
+            df = loader(sheet)
+        except Exception:
+            self.conteggi[sheet, "errore"] += 1
+            if rigorosa: raise
+            return pd.DataFrame()
+        with self._lock:
+            if self._versione_scritture(sheet) == prima: self._put(sheet, df)
+        return df
+
+    def _versione_scritture(self, sheet):
+        return self._scritture[sheet], self._scritture[None]
+
+    def version(self, sheet):
+        e = self._entries.get(sheet)
+        return e["ver"] if e else 0
+
+    def _put(self, sheet, df, derivati=None):
+        self._seq += 1
+        self._entries[sheet] = {"df": df, "ver": self._seq, "ts": time.monotonic(), "derivati": derivati or {}}
+
+    def derived(self, sheet, nome, fn, loader, incr=None):
+        """Valore calcolato dal foglio (es. diario normalizzato), legato alla sua versione.
+
+        incr(prev, righe, segno), se passato, aggiorna il valore dopo un append
+        (segno=1) o un'eliminazione (segno=-1) invece di ricalcolarlo da zero;
+        se restituisce None il valore viene ricalcolato al prossimo accesso.
+        """
+        df = self.get(sheet, loader)
+        e = self._entries.get(sheet)
+        voce = f"{sheet}:{nome}"
+        if e is None or e["df"] is not df:
+            self.conteggi[voce, "miss"] += 1
+            return fn(df)
+        if nome not in e["derivati"]:
+            self.conteggi[voce, "miss"] += 1
+            e["derivati"][nome] = (fn(df), incr)
+        else: self.conteggi[voce, "hit"] += 1
+        return e["derivati"][nome][0]
+
+    def statistiche(self):
+        """Hit/miss per foglio e per valore derivato"""
+        voci = sorted({v for v, _ in self.conteggi})
+        hit = [self.conteggi[v, "hit"] for v in voci]; miss = [self.conteggi[v, "miss"] for v in voci]
+        return pd.DataFrame({"voce": voci, "hit": hit, "miss": miss,
+                             "hit_rate": [h / (h + m) if h + m else 0.0 for h, m in zip(hit, miss)]})
+
+    def set(self, sheet, df):
+        # Dopo una riscrittura completa il frame inviato È il contenuto del foglio
+        with self._lock:
+            self._scritture[sheet] += 1
+            self._put(sheet, df.reset_index(drop=True))
+
+    def patch_append(self, sheet, df_new):
+        # Aggiunge in cache le righe appena scritte: nessun refetch al prossimo rerun
+        with self._lock:
+            self._scritture[sheet] += 1
+            e = self._entries.get(sheet)
+            if not self._valida(e): return
+            n = int(e["df"].index.max()) + 1 if len(e["df"]) else 0
+            df_new = df_new.set_axis(range(n, n + len(df_new)))
+            self._put(sheet, pd.concat([e["df"], df_new]), self._derivati(e, df_new, 1))
+
+    def patch_drop(self, sheet, labels):
+        # Toglie dalla cache le righe eliminate (gli indici delle altre non cambiano)
+        with self._lock:
+            self._scritture[sheet] += 1
+            e = self._entries.get(sheet)
+            if not self._valida(e): return
+            via = e["df"].loc[e["df"].index.intersection(labels)]
+            self._put(sheet, e["df"].drop(index=via.index), self._derivati(e, via, -1))
+
+    @staticmethod
+    def _derivati(e, righe, segno):
+        # I derivati incrementali si aggiornano con le sole righe toccate, gli altri si ricalcolano
+        out = {}
+        for k, (v, incr) in e["derivati"].items():
+            if not incr: continue
+            nuovo = incr(v, righe, segno)
+            if nuovo is not None: out[k] = (nuovo, incr)  # None: l'incremento non basta, ricalcolo al prossimo accesso
+        return out
+
+    def invalidate(self, sheet=None):
+        with self._lock:
+            self._scritture[sheet] += 1
+            if sheet is None: self._entries.clear()
+            else: self._entries.pop(sheet, None)
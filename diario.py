@@ -0,0 +1,282 @@
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+# ==========================================
+# 📒 NORMALIZZAZIONE DIARIO (tabelle tipizzate)
+# ==========================================
+# tipo nel foglio -> nome tabella
+TABELLE = {
+    "pasto": "pasti",
+    "allenamento": "allenamenti",
+    "acqua": "acqua",
+    "misure": "misure",
+    "settings": "settings",
+    "calisthenics": "skills",
+}
+
+# Colonne garantite per tabella con il default (str = testo, float = numero, nan = numero opzionale)
+SCHEMA = {
+    "pasti": {"pasto": "Spuntino", "nome": "", "gr": 0.0, "unita": "g", "cal": 0.0, "pro": 0.0, "carb": 0.0, "fat": 0.0},
+    "allenamenti": {"nome_sessione": "Workout", "durata": 0.0, "esercizi": list},
+    "acqua": {"ml": 0.0},
+    "misure": {"peso": np.nan, "alt": np.nan, "collo": np.nan, "vita": np.nan, "fianchi": np.nan},
+    "settings": {},  # chiavi libere (url_foto, target_*)
+    "skills": {"nome": "", "desc": "", "url": ""},
+}
+
+ELIMINAZIONE = "eliminazione"  # tombstone: {"id": <riga eliminata>, "tipo": <suo tipo>}
+
+
+def safe_parse_json(json_str):
+    """Helper per evitare crash su JSON corrotti"""
+    try:
+        if pd.isna(json_str) or json_str == "": return {}
+        d = json.loads(json_str)
+        return d if isinstance(d, dict) else {}
+    except: return {}
+
+
+def _tipizza(t, schema):
+    for col, default in schema.items():
+        if col not in t.columns: t[col] = np.nan
+        if default is list:
+            t[col] = [x if isinstance(x, list) else [] for x in t[col]]
+        elif isinstance(default, str):
+            t[col] = t[col].where(t[col].notna(), default).astype(str)
+        else:
+            t[col] = pd.to_numeric(t[col], errors="coerce")
+            if not np.isnan(default): t[col] = t[col].fillna(default)
+    return t
+
+
+def id_testo(v):
+    # ID senza prefisso di sole cifre letti dal foglio come numero: di nuovo le 12 cifre originali
+    if isinstance(v, (int, np.integer)) or (isinstance(v, (float, np.floating)) and float(v).is_integer()): return f"{int(v):012d}"
+    return str(v)
+
+
+def id_righe(df):
+    """ID di ogni riga: colonna 'id' se valorizzata, altrimenti (righe storiche) hash del
+    contenuto + numero di occorrenza, stabile tra una rilettura e l'altra"""
+    if df.empty: return pd.Series([], index=df.index, dtype=object)
+    ids = df["id"] if "id" in df.columns else pd.Series(np.nan, index=df.index)
+    manca = ids.isna() | (ids.astype(str) == "")
+    if not pd.api.types.is_string_dtype(ids): ids = ids.map(id_testo, na_action="ignore")
+    if not manca.any(): return ids.astype(str)
+    chiave = (df["data"].astype(str) + "|" + df["tipo"].astype(str) + "|" + df["dettaglio_json"].astype(str))[manca]
+    occ = chiave.groupby(chiave, sort=False).cumcount().astype(str)
+    hashati = [f"h{hashlib.sha1(f'{c}|{o}'.encode()).hexdigest()[:11]}" for c, o in zip(chiave, occ)]
+    return ids.astype(object).mask(manca, pd.Series(hashati, index=chiave.index)).astype(str)
+
+
+def eliminati(df):
+    """ID colpiti da una riga 'eliminazione'"""
+    if df.empty or "tipo" not in df.columns: return set()
+    return {d.get("id") for d in map(safe_parse_json, df.loc[df["tipo"] == ELIMINAZIONE, "dettaglio_json"])} - {None}
+
+
+def _tabella(sub, nome):
+    recs = [safe_parse_json(x) for x in sub["dettaglio_json"]]
+    t = pd.DataFrame(recs, index=sub.index) if recs else pd.DataFrame(index=sub.index)
+    t = _tipizza(t, SCHEMA[nome])
+    t.insert(0, "data", pd.to_datetime(sub["data"], errors="coerce"))
+    t.index = pd.Index(sub["id"], name="id")  # ID persistente della riga (per le eliminazioni)
+    # Ordinata per data (stabile: nello stesso giorno resta l'ordine di inserimento)
+    return t.sort_values("data", kind="stable")
+
+
+def normalizza_diario(df):
+    """Diario grezzo (data/tipo/dettaglio_json/id) -> dict di tabelle tipizzate per tipo.
+
+    Il JSON di ogni riga viene parsato una volta sola; l'indice delle tabelle è
+    l'ID della riga. Le righe colpite da un'eliminazione (tombstone) non compaiono.
+    """
+    vuoto = pd.DataFrame({"tipo": [], "data": [], "dettaglio_json": [], "id": []})
+    if df.empty or "tipo" not in df.columns: df = vuoto
+    df = df.assign(id=id_righe(df))
+    morti = eliminati(df)
+    if morti: df = df[~df["id"].isin(morti)]
+    gruppi = dict(tuple(df.groupby("tipo", sort=False)))
+    return {nome: _tabella(gruppi.get(tipo, vuoto), nome) for tipo, nome in TABELLE.items()}
+
+
+def aggiorna_norm(norm, righe, segno=1):
+    """Aggiornamento incrementale: normalizza solo le righe nuove (o toglie quelle eliminate)"""
+    if segno < 0:
+        ids = id_righe(righe)
+        return {k: t.drop(index=ids, errors="ignore") for k, t in norm.items()}
+    nuove = normalizza_diario(righe)
+    morti = eliminati(righe)
+    out = {}
+    for k, t in norm.items():
+        if morti: t = t.drop(index=list(morti), errors="ignore")
+        if len(nuove[k]):
+            t = pd.concat([t, nuove[k]])
+            # Inserimento retrodatato (calendario): si riordina, altrimenti resta ordinata
+            if not t["data"].is_monotonic_increasing: t = t.sort_values("data", kind="stable")
+        out[k] = t
+    return out
+
+
+def trova_riga(norm, id_riga):
+    """(tipo, data "YYYY-MM-DD") della riga con quell'ID, None se non c'è (es. già eliminata)"""
+    for tipo, nome in TABELLE.items():
+        t = norm[nome]
+        if id_riga in t.index:
+            d = t.at[id_riga, "data"]
+            return tipo, d.strftime("%Y-%m-%d") if pd.notna(d) else ""
+    return None
+
+
+def fetta(t, inizio, fine=None):
+    """Righe con data in [inizio, fine] con ricerca binaria (tabella ordinata per data)"""
+    d = t["data"].values
+    lo = d.searchsorted(np.datetime64(pd.Timestamp(inizio)), "left")
+    hi = d.searchsorted(np.datetime64(pd.Timestamp(fine if fine is not None else inizio)), "right")
+    return t.iloc[lo:hi]
+
+
+# ==========================================
+# ⚙️ SETTINGS (foglio chiave/valore)
+# ==========================================
+SETTINGS_DEFAULT = {"url_foto": "", "target_cal": 2500, "target_pro": 180, "target_carb": 300, "target_fat": 80}
+
+
+def _valore(chiave, v):
+    if v is None or (isinstance(v, float) and np.isnan(v)): return SETTINGS_DEFAULT.get(chiave, "")
+    if isinstance(SETTINGS_DEFAULT.get(chiave), (int, float)):
+        try:
+            f = float(v)
+            return int(f) if f.is_integer() else f
+        except (TypeError, ValueError): return SETTINGS_DEFAULT[chiave]
+    return v.item() if hasattr(v, "item") else v
+
+
+def settings_da_kv(df_kv):
+    """Foglio settings (chiave/valore) -> dict completo di default"""
+    settings = dict(SETTINGS_DEFAULT)
+    if not df_kv.empty and {"chiave", "valore"} <= set(df_kv.columns):
+        for k, v in zip(df_kv["chiave"], df_kv["valore"]):
+            if isinstance(k, str) and k: settings[k] = _valore(k, v)
+    return settings
+
+
+def kv_da_settings(settings):
+    return pd.DataFrame({"chiave": list(settings), "valore": list(settings.values())})
+
+
+def ultimo_snapshot_settings(norm):
+    """Vecchio formato: ultimo snapshot 'settings' salvato nel diario (o None)"""
+    rows = norm["settings"]
+    if rows.empty: return None
+    ultimo = rows.iloc[-1].drop("data").dropna()
+    return {**SETTINGS_DEFAULT, **{k: _valore(k, v) for k, v in ultimo.items()}}
+
+
+# ==========================================
+# 🏆 XP LEDGER (contatori per tipo)
+# ==========================================
+XP_PER_TIPO = {"pasto": 5, "allenamento": 20, "misure": 10, "acqua": 2}
+
+
+class Conteggi(dict):
+    """Righe per tipo; morti = ID già scalati da un tombstone (due tombstone dello stesso ID, es. da
+    due sessioni, scalano una volta sola)"""
+
+    def __init__(self, conteggi=(), morti=frozenset()):
+        super().__init__(conteggi)
+        self.morti = frozenset(morti)
+
+
+def conta_tipi(df):
+    """Ricostruzione completa dei contatori (solo a cache miss)"""
+    if df.empty or "tipo" not in df.columns: return Conteggi()
+    morti = eliminati(df)
+    ids = id_righe(df)
+    vivi = df[(df["tipo"] != ELIMINAZIONE) & ~ids.isin(morti)] if morti else df[df["tipo"] != ELIMINAZIONE]
+    out = {k: int(v) for k, v in vivi["tipo"].value_counts().items()}
+    # Tombstone di righe non presenti (archiviate): scalano il loro tipo una volta per ID, come nell'aggiornamento incrementale
+    presenti, assenti = set(ids), {}
+    for js in df.loc[df["tipo"] == ELIMINAZIONE, "dettaglio_json"]:
+        d = safe_parse_json(js)
+        if d.get("id") not in presenti and d.get("tipo"): assenti.setdefault(d["id"], d["tipo"])
+    for tipo in assenti.values(): out[tipo] = out.get(tipo, 0) - 1
+    return Conteggi(out, morti)
+
+
+def aggiorna_conteggi(conteggi, righe, segno=1):
+    """Aggiorna i contatori con le sole righe aggiunte/eliminate (un tombstone scala il tipo eliminato,
+    se il suo ID non era già stato scalato). None: tombstone tolti, si ricalcola da zero"""
+    out, morti = dict(conteggi), set(getattr(conteggi, "morti", ()))
+    for tipo, js in zip(righe["tipo"], righe["dettaglio_json"]):
+        if tipo == ELIMINAZIONE:
+            if segno < 0: return None
+            d = safe_parse_json(js)
+            tipo, segno_riga = d.get("tipo"), -segno
+            if tipo is None or d.get("id") in morti: continue
+            morti.add(d.get("id"))
+        else: segno_riga = segno
+        out[tipo] = out.get(tipo, 0) + segno_riga
+    return Conteggi(out, morti)
+
+
+def xp_totale(conteggi):
+    return sum(conteggi.get(t, 0) * xp for t, xp in XP_PER_TIPO.items())
+
+
+# ==========================================
+# 📊 AGGREGAZIONI (vettoriali)
+# ==========================================
+MACRO = ["cal", "pro", "carb", "fat"]
+CATEGORIE_PASTO = ["Colazione", "Pranzo", "Cena", "Spuntino", "Integrazione"]
+
+
+def _nel_periodo(t, inizio=None, fine=None):
+    if inizio is None and fine is None: return t
+    return fetta(t, inizio if inizio is not None else pd.Timestamp.min, fine if fine is not None else pd.Timestamp.max)
+
+
+def aggrega(norm, inizio=None, fine=None):
+    """Totali per (giorno, categoria pasto) e per giorno su un intervallo di date.
+
+    Un solo groupby sui pasti; i totali giornalieri si ottengono sommando le
+    categorie (poche righe per giorno) e aggiungendo l'acqua.
+    """
+    p = _nel_periodo(norm["pasti"], inizio, fine)
+    a = _nel_periodo(norm["acqua"], inizio, fine)
+    categoria = p["pasto"].where(p["pasto"].isin(CATEGORIE_PASTO), "Spuntino").rename("categoria")
+    per_pasto = p.groupby([p["data"], categoria])[MACRO].sum()
+    giorni = per_pasto.groupby(level="data").sum()
+    acqua = a.groupby("data")["ml"].sum().rename("acqua")
+    giorni = giorni.join(acqua, how="outer").fillna(0.0)
+    return {"giorni": giorni, "per_pasto": per_pasto}
+
+
+def riepilogo_giorno(agg, giorno):
+    """Totali di un giorno: macro, acqua e kcal per categoria di pasto"""
+    g = pd.Timestamp(giorno)
+    giorni, per_pasto = agg["giorni"], agg["per_pasto"]
+    tot = giorni.loc[g] if g in giorni.index else pd.Series(0.0, index=MACRO + ["acqua"])
+    try: cal_per_pasto = per_pasto["cal"].loc[g].to_dict()
+    except KeyError: cal_per_pasto = {}
+    out = {k: float(tot.get(k, 0.0)) for k in MACRO + ["acqua"]}
+    out["cal_per_pasto"] = {c: float(cal_per_pasto.get(c, 0.0)) for c in CATEGORIE_PASTO}
+    return out
+
+
+def rollup(giorni, freq="W", target_cal=None, tolleranza=0.10):
+    """Medie settimanali ("W") o mensili ("MS") sui giorni con pasti registrati.
+
+    aderenza = % di giorni con kcal entro ±tolleranza dal target.
+    """
+    mangiato = giorni[giorni["cal"] > 0]
+    if mangiato.empty: return pd.DataFrame(columns=MACRO + ["giorni", "aderenza"])
+    r = mangiato.resample(freq)
+    out = r[MACRO].mean()
+    out["giorni"] = r["cal"].count()
+    if target_cal:
+        entro = (mangiato["cal"] - target_cal).abs() <= tolleranza * target_cal
+        out["aderenza"] = entro.resample(freq).mean() * 100
+    return out[out["giorni"] > 0]
@@ -1,16 +1,35 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-import json
 import datetime
+import os
+from collections import deque
+import threading
+import shutil
 import time
 import altair as alt
 import google.generativeai as genai
+from db_engine import GSheetsBackend, apri_spreadsheet, SQLiteBackend, SyncedBackend, CodaScritture, SheetCache, nuova_riga_diario
+from diario import normalizza_diario, aggiorna_norm, fetta, aggrega, riepilogo_giorno, rollup
+from diario import ELIMINAZIONE, id_righe, trova_riga, eliminati
+from archivio import RIEPILOGO, RECORD, basi_incoerenti, foglio_anno, anno_limite, pianifica_archivio, unisci_partizione, riepilogo_giorni, sostituisci_anno
+from archivio import leggi_riepilogo, impronta_anno, anni_archiviati, conteggi_archiviati, misure_archiviate, giorni_storico, unisci_norm, senza_eliminati
+from diario import conta_tipi, aggiorna_conteggi, xp_totale
+from diario import settings_da_kv, kv_da_settings, ultimo_snapshot_settings
+from catalogo import IndiceCatalogo, esercizi_per_categoria
+from peso import serie_peso, punti_grafico, variazione, FINESTRE
+from allenamenti import tabella_set, aggiorna_set, volume_settimanale, progressione
+from allenamenti import indice_pr, aggiorna_pr, unisci_voci, righe_record, indice_da_record, sostituisci_record
+from coach import Coach, GeminiClient, StubClient
+from profilo import Profilo, esporta_json, esporta_csv
+from scambio import ESPORTABILI, esporta, valida_import, lotti, leggi_file
+import colonnare
 
 # ==========================================
 # 🎨 UI/UX DESIGN SYSTEM (V14.5 - FINAL FORCE LIGHT THEME)
 # ==========================================
 st.set_page_config(page_title="Fit Tracker Pro", page_icon="⚡", layout="wide")
+_t_pagina = time.perf_counter()  # tempo di esecuzione dello script (mostrato in fondo alla pagina)
 
 st.markdown("""
 <style>
@@ -155,74 +174,358 @@ try:
         gemini_ok = True
 except: pass
 
+@st.cache_resource
+def get_coach():
+    """Coach condiviso dal processo (thread + cache risposte); None se l'AI non è configurata"""
+    if gemini_ok: return Coach(GeminiClient(model))
+    # COACH = "stub": risposte finte locali (sviluppo/test senza API key)
+    if "COACH" in st.secrets and st.secrets["COACH"] == "stub": return Coach(StubClient())
+    return None
+
 # ==========================================
 # 🚀 DATABASE ENGINE & HELPERS
 # ==========================================
-conn = st.connection("gsheets", type=GSheetsConnection)
-
-@st.cache_data(ttl=600)
-def fetch_data_cached(sheet_name):
-    try: 
-        return conn.read(worksheet=sheet_name)
-    except Exception as e:
-        return pd.DataFrame()
+# STORAGE: "gsheets" (diretto), "locale" (SQLite + sync in background), "offline" (solo SQLite)
+@st.cache_resource
+def get_backend():
+    modo = st.secrets["STORAGE"] if "STORAGE" in st.secrets else "gsheets"
+    path = st.secrets["LOCAL_DB"] if "LOCAL_DB" in st.secrets else "fitness_local.db"
+    if modo == "offline": return SQLiteBackend(path)
+    # Append con gspread (API pubblica) usando le stesse credenziali della connessione
+    cfg = dict(st.secrets["connections"]["gsheets"]) if "connections" in st.secrets else {}
+    remoto = GSheetsBackend(st.connection("gsheets", type=GSheetsConnection), apri=lambda: apri_spreadsheet(cfg))
+    if modo == "locale": return SyncedBackend(SQLiteBackend(path), remoto).start()
+    return remoto
+
+@st.cache_resource
+def get_sheet_cache(): return SheetCache(ttl=600)
+
+@st.cache_resource
+def get_coda(): return CodaScritture(get_backend())
+
+@st.cache_resource
+def get_profilo(): return Profilo()
+
+# Pannello performance nella sidebar solo con DEV = true nei secrets
+DEV = "DEV" in st.secrets and bool(st.secrets["DEV"])
+# Anni tenuti nel foglio "diario" (corrente + precedenti); gli altri vanno in diario_<anno>. 0 = niente archivio
+ANNI_CALDI = int(st.secrets["ANNI_CALDI"]) if "ANNI_CALDI" in st.secrets else 2
+# Copie locali in formato colonnare degli anni archiviati (una cartella per anno)
+DIR_COLONNARE = st.secrets["DIR_COLONNARE"] if "DIR_COLONNARE" in st.secrets else "diario_colonnare"
+# Stato per sessione solo delta piccoli: della chat col Coach si tengono gli ultimi messaggi
+CHAT_MAX = 20
+
+backend = get_backend()
+sheet_cache = get_sheet_cache()
+coda = get_coda()
+profilo = get_profilo()
+# Righe arrivate dal foglio durante il sync: invalida solo quel foglio
+if isinstance(backend, SyncedBackend): backend.on_change = sheet_cache.invalidate
+# Scrittura fallita: la cache ottimistica non è più affidabile per quel foglio
+coda.on_errore = sheet_cache.invalidate
+# Riscrittura fusa con righe di altre sessioni: la cache va riletta
+coda.on_change = sheet_cache.invalidate
+
+def _read_sheet(sheet_name):
+    coda.attendi(sheet_name, timeout=30)  # una rilettura deve vedere le scritture ancora in coda per quel foglio
+    # Errori di lettura risalgono: SheetCache non mette in cache un foglio letto male
+    with profilo.misura(f"fetch:{sheet_name}"): return backend.read(sheet_name)
+
+def fetch_data_cached(sheet_name): return sheet_cache.get(sheet_name, _read_sheet)
 
 def get_data(sheet): return fetch_data_cached(sheet)
 
-def save_data(sheet, df):
-    df = df.fillna("") 
-    conn.update(worksheet=sheet, data=df)
-    fetch_data_cached.clear()
-    st.cache_data.clear()
+def get_data_sicura(sheet):
+    """Come get_data, ma una lettura fallita è un errore: base di scritture, mai un foglio vuoto"""
+    return sheet_cache.get(sheet, _read_sheet, rigorosa=True)
 
-def safe_parse_json(json_str):
-    """Helper per evitare crash su JSON corrotti"""
-    try:
-        if pd.isna(json_str) or json_str == "": return {}
-        return json.loads(json_str)
-    except: return {}
+def save_data(sheet, df):
+    # Versione da cui deriva la riscrittura: se nel frattempo altri hanno scritto, la coda fonde
+    base = get_data_sicura(sheet)
+    # Invalidazione mirata: solo questo foglio, già aggiornato col frame scritto
+    sheet_cache.set(sheet, df)
+    coda.update(sheet, df.fillna(""), base=base.fillna("") if len(base.columns) else None)
+
+def append_data(sheet, df_new):
+    """Scrittura append-only: invia al foglio solo le righe nuove"""
+    df = get_data_sicura(sheet)
+    if df.empty or not set(df_new.columns) <= set(df.columns):
+        # Prima di riscrivere si rilegge il foglio: la copia in cache può essere di qualche minuto fa
+        sheet_cache.invalidate(sheet)
+        df = get_data_sicura(sheet)
+    # Foglio davvero vuoto o senza header: serve una scrittura completa (crea le colonne)
+    if df.empty or not set(df_new.columns) <= set(df.columns):
+        tutto = pd.concat([df, df_new], ignore_index=True)
+        # Prima riga con colonna 'id': le righe storiche ricevono il loro ID una volta per tutte
+        if sheet == "diario": tutto["id"] = id_righe(tutto)
+        save_data(sheet, tutto)
+        return
+    sheet_cache.patch_append(sheet, df_new.reindex(columns=df.columns))
+    coda.append(sheet, df_new.reindex(columns=df.columns).fillna(""))
+
+def _normalizza(df):
+    with profilo.misura("normalizza"): return normalizza_diario(df)
+
+def _aggiorna_norm(norm, righe, segno=1):
+    with profilo.misura("normalizza:incr"): return aggiorna_norm(norm, righe, segno)
+
+def get_diario_norm():
+    """Tabelle tipizzate del diario (pasti, allenamenti, acqua, misure, settings, skills)"""
+    return sheet_cache.derived("diario", "norm", _normalizza, _read_sheet, incr=_aggiorna_norm)
 
 # [FIX] Aggiunta parametro data_custom per back-logging
 def add_riga_diario(tipo, dati, data_custom=None):
-    df = get_data("diario")
-    if df.empty: df = pd.DataFrame(columns=["data", "tipo", "dettaglio_json"])
-    
     # Se passata una data specifica (es. dal calendario), usiamo quella
-    target_date = data_custom if data_custom else datetime.datetime.now().strftime("%Y-%m-%d")
-    
-    nuova = pd.DataFrame([{"data": target_date, "tipo": tipo, "dettaglio_json": json.dumps(dati)}])
-    df_totale = pd.concat([df, nuova], ignore_index=True)
-    save_data("diario", df_totale)
-
-def delete_riga(idx):
-    df = get_data("diario")
-    if idx in df.index:
-        save_data("diario", df.drop(idx))
-    else:
-        st.warning("Impossibile trovare la riga. Ricarico...")
-        time.sleep(1)
-        st.cache_data.clear()
-        st.rerun()
+    with profilo.misura("add_riga_diario"):
+        nuova = nuova_riga_diario(tipo, dati, data_custom)
+        append_data("diario", nuova)
+
+# ==========================================
+# 📝 MODIFICHE IN SOSPESO (buffer di sessione)
+# ==========================================
+AUTOSAVE_S = 30  # commit automatico dopo N secondi dall'ultima modifica
+
+def get_pending(): return st.session_state.setdefault("pending", [])
+
+def accoda(sheet, riga):
+    """Mette la riga nel buffer della sessione: verrà scritta al prossimo commit"""
+    get_pending().append((sheet, riga))
+    st.session_state["pending_ts"] = time.time()
+
+def accoda_diario(tipo, dati, data_custom=None):
+    accoda("diario", nuova_riga_diario(tipo, dati, data_custom).iloc[0].to_dict())
+
+def commit_pending():
+    """Una sola scrittura (append) per foglio con tutte le righe in sospeso"""
+    pending = get_pending()
+    for sheet in list(dict.fromkeys(s for s, _ in pending)):
+        append_data(sheet, pd.DataFrame([r for s, r in pending if s == sheet]))
+        pending[:] = [(s, r) for s, r in pending if s != sheet]
+
+def righe_pending_diario():
+    """Righe di diario non ancora salvate (hanno già il loro ID)"""
+    return pd.DataFrame([r for s, r in get_pending() if s == "diario"])
+
+def delete_riga(id_riga, norm_vista=None):
+    """Eliminazione per ID: append di una riga 'eliminazione', il foglio non viene riscritto.
+
+    norm_vista: tabelle in cui cercare la riga (es. diario caldo + partizione archiviata).
+    """
+    pending = get_pending()
+    for i, (s, r) in enumerate(pending):
+        if s == "diario" and r.get("id") == id_riga:
+            pending.pop(i)  # riga ancora nel buffer: basta toglierla
+            return
+    with profilo.misura("delete_riga"):
+        # Tombstone già scritto (es. da un'altra sessione): non se ne aggiunge un secondo
+        if id_riga in sheet_cache.derived("diario", "eliminati", eliminati, _read_sheet): return
+        trovata = trova_riga(norm_vista if norm_vista is not None else get_diario_norm(), id_riga)
+        # Già eliminata (es. da un'altra sessione): niente da fare
+        if trovata is not None:
+            tipo, data = trovata  # la data dice in quale partizione sta la riga
+            add_riga_diario(ELIMINAZIONE, {"id": id_riga, "tipo": tipo, "data": data})
+
+def get_aggregati():
+    """Totali per giorno e per categoria pasto su tutto lo storico (cache per versione del diario)"""
+    return sheet_cache.derived("diario", "aggregati", lambda _: aggrega(get_diario_norm()), _read_sheet)
+
+def migra_settings():
+    """Sposta l'ultimo snapshot 'settings' dal diario al foglio settings e compatta il diario"""
+    legacy = ultimo_snapshot_settings(get_diario_norm())
+    if legacy is None: return None
+    try:
+        save_data("settings", kv_da_settings(legacy))
+        df = get_data("diario")
+        vecchi = df.index[df["tipo"] == "settings"]
+        coda.update("diario", df.drop(index=vecchi).fillna(""), base=df.fillna(""))
+        sheet_cache.patch_drop("diario", vecchi)
+    except Exception: pass  # si riprova al prossimo avvio, intanto vale lo snapshot
+    return legacy
+
+def get_riepilogo():
+    """Totali giornalieri degli anni archiviati (una riga per giorno, letto al posto delle partizioni)"""
+    return sheet_cache.derived(RIEPILOGO, "tabella", leggi_riepilogo, _read_sheet)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _partizione_norm(anno, chiave):
+    """Tabelle di un anno archiviato: dalla copia colonnare locale se è della stessa versione
+    (chiave = impronta del riepilogo), altrimenti dal foglio, e la copia si riscrive.
+
+    Una lettura fallita, o un foglio vuoto per un anno che il riepilogo conta, solleva:
+    cache_resource non tiene le eccezioni e su disco non si scrive nulla.
+    """
+    cartella = os.path.join(DIR_COLONNARE, str(anno))
+    m, riep = colonnare.manifest(cartella), get_data(RIEPILOGO)
+    # Copia senza righe per un anno che il riepilogo conta: viene da una lettura sbagliata, non vale
+    if m is not None and m["meta"].get("chiave") == chiave and (sum(m["righe"].values()) or not basi_incoerenti(riep, {anno: pd.DataFrame()})):
+        try:
+            with profilo.misura("colonnare:leggi"): return colonnare.leggi(cartella)
+        except (OSError, ValueError): pass  # copia rovinata: si rilegge il foglio
+    df = _read_sheet(foglio_anno(anno))
+    motivo = basi_incoerenti(riep, {anno: df})
+    if motivo: raise ValueError(motivo)
+    norm_a = _normalizza(df)
+    try: colonnare.scrivi(norm_a, cartella, {"anno": anno, "chiave": chiave})
+    except OSError: pass  # disco in sola lettura: si resta sul foglio
+    return norm_a
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _set_partizione(anno, chiave):
+    return tabella_set(_partizione_norm(anno, chiave)["allenamenti"])
+
+def get_partizione_norm(anno):
+    """Tabelle di un anno archiviato: lette solo quando servono (date picker, Storico)"""
+    try: norm_a = _partizione_norm(anno, impronta_anno(get_riepilogo(), anno))
+    except Exception: return normalizza_diario(pd.DataFrame())  # come get_data: vuoto per ora, si rilegge alla prossima
+    return senza_eliminati(norm_a, sheet_cache.derived("diario", "eliminati", eliminati, _read_sheet))
+
+def con_archivio(norm, giorno):
+    """Se il giorno cade in un anno archiviato, aggiunge alle tabelle la partizione di quell'anno"""
+    anno = pd.Timestamp(giorno).year
+    return unisci_norm(norm, get_partizione_norm(anno)) if anno in anni_archiviati(get_riepilogo()) else norm
+
+def archivia_diario(limite):
+    """Sposta le righe degli anni < limite nelle partizioni per anno e aggiorna riepilogo e record.
+
+    Partizioni e riepilogo sono scritti (e confermati) prima di togliere le righe dal diario caldo;
+    nessun foglio viene riscritto da una base non letta o incoerente col riepilogo.
+    """
+    caldo, piano = pianifica_archivio(get_data_sicura("diario"), limite)
+    if not piano: return 0
+    with profilo.misura("archivio"):
+        # Basi lette con successo (una lettura fallita interrompe tutto) e coerenti col riepilogo
+        riep, rec, n_errori = get_data_sicura(RIEPILOGO), get_data_sicura(RECORD), len(coda.errori)
+        partizioni = {anno: get_data_sicura(foglio_anno(anno)) for anno in piano}
+        if basi_incoerenti(riep, partizioni): return 0
+        for anno, (righe, via) in sorted(piano.items()):
+            part = unisci_partizione(partizioni[anno], righe, via)
+            save_data(foglio_anno(anno), part)
+            shutil.rmtree(os.path.join(DIR_COLONNARE, str(anno)), ignore_errors=True)  # copia locale superata
+            norm_part = normalizza_diario(part)
+            riep = sostituisci_anno(riep, anno, riepilogo_giorni(norm_part))
+            rec = sostituisci_record(rec, anno, righe_record(indice_pr(tabella_set(norm_part["allenamenti"])), anno))
+        save_data(RIEPILOGO, riep)
+        save_data(RECORD, rec)
+        coda.attendi(timeout=120)
+        if len(coda.errori) > n_errori: return 0  # partizioni non confermate: il diario caldo resta com'è
+        save_data("diario", caldo)
+    return sum(len(r) for r, _ in piano.values())
+
+@st.cache_resource(show_spinner=False)
+def archivio_avviato(limite):
+    """Archiviazione una volta per processo e per anno limite (a capodanno riparte da sola).
+
+    Gira in un thread: l'attesa delle conferme di scrittura non blocca nessun rerun, le sessioni
+    vedono fogli e cache aggiornati appena archivia_diario li salva. esito["righe"]: None finché lavora.
+    """
+    esito = {"righe": None}
+    def lavora():
+        try: esito["righe"] = archivia_diario(limite)
+        except Exception: esito["righe"] = 0
+    threading.Thread(target=lavora, name="archivio", daemon=True).start()
+    return esito
+
+def misure_peso(norm):
+    """Pesate: una al giorno dal riepilogo per gli anni archiviati, tutte dal diario caldo"""
+    riep = get_riepilogo()
+    if riep.empty: return norm["misure"]
+    return pd.concat([misure_archiviate(riep), norm["misure"][["data", "peso"]]], ignore_index=True)
+
+def get_serie_peso():
+    """Serie giornaliera del peso con trend e kg/settimana (cache per versione del diario)"""
+    return sheet_cache.derived("diario", "peso", lambda _: serie_peso(misure_peso(get_diario_norm())), _read_sheet)
+
+def sorgenti_diario():
+    """Frame grezzi del diario uno alla volta: anni archiviati (letti ora, fuori dalla cache), poi il diario caldo"""
+    for anno in anni_archiviati(get_riepilogo()): yield _read_sheet(foglio_anno(anno))
+    yield get_data("diario")
+
+def esporta_diario(tabella, formato):
+    """Export a blocchi di una tabella su tutto lo storico (chiamato dal download, fuori dal rerun)"""
+    with profilo.misura(f"esporta:{tabella}"):
+        return esporta(sorgenti_diario(), tabella, formato, eliminati(get_data("diario")))
+
+def importa_righe(righe):
+    """Import in blocco: un append per lotto invece di una scrittura per riga; gli ID già presenti si saltano"""
+    esistenti = set(id_righe(get_data("diario")))
+    # Righe di anni archiviati: si controllano anche quelle partizioni (es. reimport di un export completo)
+    anni = set(pd.to_datetime(righe["data"]).dt.year) & set(anni_archiviati(get_riepilogo()))
+    for anno in anni: esistenti |= set(id_righe(get_data(foglio_anno(anno))))
+    n = 0
+    with profilo.misura("importa"):
+        for lotto in lotti(righe, esistenti):
+            append_data("diario", lotto)
+            n += len(lotto)
+    return n
+
+def get_tabella_set():
+    """Esercizi di tutte le sessioni (una riga per serie×reps@kg): a ogni sessione salvata si aggiungono solo i nuovi"""
+    return sheet_cache.derived("diario", "set", lambda _: tabella_set(get_diario_norm()["allenamenti"]), _read_sheet, incr=aggiorna_set)
+
+def get_set_partizione(anno):
+    """Esercizi di un anno archiviato (letto solo su richiesta), senza le sessioni eliminate"""
+    try: tab = _set_partizione(anno, impronta_anno(get_riepilogo(), anno))
+    except Exception: return tabella_set(normalizza_diario(pd.DataFrame())["allenamenti"])
+    return tab[~tab["id"].isin(sheet_cache.derived("diario", "eliminati", eliminati, _read_sheet))]
+
+def get_pr():
+    """Record per esercizio del diario caldo: una sessione salvata aggiorna solo i suoi esercizi"""
+    return sheet_cache.derived("diario", "pr", lambda _: indice_pr(get_tabella_set()), _read_sheet, incr=aggiorna_pr)
+
+def pr_esercizio(nome, tipo):
+    """Record di un esercizio su tutto lo storico (anni archiviati dal foglio record)"""
+    arch = sheet_cache.derived(RECORD, "indice", indice_da_record, _read_sheet)
+    return unisci_voci(arch.get((nome, tipo)), get_pr().get((nome, tipo)))
+
+def box_pr(nome, tipo, kg=None):
+    """Ultima volta e record dell'esercizio scelto (lookup nell'indice, nessun parsing)"""
+    voce = pr_esercizio(nome, tipo) if nome else None
+    if not voce: return
+    u, n = voce["ultimo"], lambda x: f"{x:g}" if pd.notna(x) else "-"
+    if tipo == "isometria": ultimo = f"{n(u['serie'])}×{n(u['tempo'])}s" + (f" +{n(u['kg'])}kg" if u['kg'] > 0 else "")
+    elif tipo == "cardio": ultimo = f"{n(u['km'])}km in {n(u['tempo'])}min"
+    else: ultimo = f"{n(u['serie'])}×{n(u['reps'])} @ {n(u['kg'])}kg"
+    if tipo == "isometria": pr = f"{n(voce['tempo'])}s"
+    elif tipo == "cardio": pr = f"{n(voce['km'])}km" + (f" · {voce['passo']:.1f} min/km" if pd.notna(voce['passo']) else "")
+    elif tipo == "pesi": pr = f"{n(voce['kg'])}kg" + (f" · 1RM ~{voce['e1rm']:.0f}kg" if pd.notna(voce['e1rm']) else "")
+    else: pr = f"{n(max(voce['reps'].values(), default=float('nan')))} reps"
+    if kg is not None and tipo != "isometria" and float(kg) in voce["reps"]: pr += f" · a {kg:g}kg: {n(voce['reps'][float(kg)])} reps"
+    data_u = u["data"].strftime("%d/%m/%y") if pd.notna(u["data"]) else ""
+    st.caption(f"🕒 Ultima volta ({data_u}): **{ultimo}** · 🏆 PR: **{pr}**")
+
+def get_indice(sheet):
+    """Indice di ricerca del catalogo (cibi/integratori), ricostruito solo quando il foglio cambia"""
+    return sheet_cache.derived(sheet, "indice", IndiceCatalogo, _read_sheet)
+
+def get_esercizi():
+    """Nomi degli esercizi per categoria (tuple condivise da tutte le sessioni)"""
+    return sheet_cache.derived("esercizi", "per_categoria", esercizi_per_categoria, _read_sheet)
 
 def get_user_settings():
-    df = get_data("diario")
-    settings = {"url_foto": "", "target_cal": 2500, "target_pro": 180, "target_carb": 300, "target_fat": 80}
-    if not df.empty:
-        rows = df[df['tipo'] == 'settings']
-        if not rows.empty:
-            try: settings.update(safe_parse_json(rows.iloc[-1]['dettaglio_json']))
-            except: pass
-    return settings
-
-# [UPDATED] Funzione Livello Aggiornata con XP Acqua
-def calculate_user_level(df):
-    if df.empty: return 1, 0, 0.0, 100
-    xp = 0
-    xp += len(df[df['tipo'] == 'pasto']) * 5
-    xp += len(df[df['tipo'] == 'allenamento']) * 20
-    xp += len(df[df['tipo'] == 'misure']) * 10
-    # Nuovo: 2 XP per ogni inserimento acqua
-    xp += len(df[df['tipo'] == 'acqua']) * 2
+    # Foglio chiave/valore dedicato: poche righe, dict in cache finché non si salva
+    with profilo.misura("get_user_settings"):
+        if get_data("settings").empty:
+            legacy = migra_settings()
+            if legacy is not None: return dict(legacy)
+        return dict(sheet_cache.derived("settings", "dict", settings_da_kv, _read_sheet))
+
+def save_user_settings(settings):
+    save_data("settings", kv_da_settings(settings))
+
+def get_xp_ledger():
+    """Contatori per tipo: ricostruiti solo a cache miss, poi aggiornati ad ogni append/eliminazione"""
+    return sheet_cache.derived("diario", "xp", conta_tipi, _read_sheet, incr=aggiorna_conteggi)
+
+def get_conteggi():
+    """Contatori del diario caldo + righe degli anni archiviati (dal riepilogo)"""
+    conteggi = dict(get_xp_ledger())
+    for tipo, n in conteggi_archiviati(get_riepilogo()).items(): conteggi[tipo] = conteggi.get(tipo, 0) + n
+    return conteggi
+
+# [UPDATED] XP da contatori: 5 pasto, 20 allenamento, 10 misure, 2 acqua
+def calculate_user_level(conteggi):
+    if not conteggi: return 1, 0, 0.0, 100
+    xp = xp_totale(conteggi)
     
     level = 1 + (xp // 500)
     current_xp = xp % 500
@@ -230,20 +533,68 @@ def calculate_user_level(df):
     progress = current_xp / next_level_xp
     return level, xp, progress, int(current_xp)
 
+def notifica(msg, icon=None):
+    """Toast che sopravvive allo st.rerun(): viene mostrato all'inizio del run successivo"""
+    st.session_state.setdefault("toasts", []).append((msg, icon))
+
+def mostra_notifiche():
+    for msg, icon in st.session_state.pop("toasts", []): st.toast(msg, icon=icon)
+    while coda.errori:
+        sheet, _ = coda.errori.popleft()
+        st.toast(f"Salvataggio su '{sheet}' non riuscito: dati ricaricati", icon="⚠️")
+
+def registra_tempo(nome, t0, fase=None):
+    """Ultimo tempo di esecuzione (ms) della pagina o di un fragment, anche nel profilo"""
+    ms = (time.perf_counter() - t0) * 1000
+    st.session_state.setdefault("tempi", {})[nome] = ms
+    profilo.registra(fase or f"fragment:{nome}", ms)
+
 def clear_form_state(keys_to_clear):
     for k in keys_to_clear:
         if k in st.session_state:
             del st.session_state[k]
 
-df = get_data("diario")
+mostra_notifiche()
 user_settings = get_user_settings()
+if ANNI_CALDI: archivio_avviato(anno_limite(datetime.date.today(), ANNI_CALDI))
+
+# Debounce: se l'ultima modifica in sospeso è abbastanza vecchia, si salva
+if get_pending() and time.time() - st.session_state.get("pending_ts", 0) > AUTOSAVE_S:
+    commit_pending()
+
+def box_pending():
+    n = len(get_pending())
+    if not n: return
+    if time.time() - st.session_state.get("pending_ts", 0) > AUTOSAVE_S:
+        commit_pending(); st.rerun()
+    st.warning(f"📝 {n} modifiche non salvate")
+    cp1, cp2 = st.columns(2)
+    if cp1.button("💾 Salva", key="pend_save", use_container_width=True):
+        commit_pending(); st.rerun()
+    if cp2.button("↩️ Annulla", key="pend_undo", use_container_width=True):
+        get_pending().clear(); st.rerun()
+
+def box_coach():
+    # Mostra i token man mano che arrivano; a risposta completa la sposta nella chat
+    job = st.session_state.coach_job
+    if job.finito:
+        if job.da_cache: profilo.registra("coach:cache", (job.t_fine - job.t_inizio) * 1000)
+        elif not job.errore:
+            profilo.registra("coach:primo_token", ((job.t_primo or job.t_fine) - job.t_inizio) * 1000)
+            profilo.registra("coach:risposta", (job.t_fine - job.t_inizio) * 1000)
+        st.session_state.chat.append({"role":"assistant","txt":job.testo if job.testo and not job.errore else "Errore AI"})
+        del st.session_state["coach_job"]; st.rerun()
+    st.info((job.testo or "💭 Il coach sta scrivendo...") + " ▌")
 
 # ==========================================
 # 📱 SIDEBAR (VERSIONE NATIVE - STABILE)
 # ==========================================
 with st.sidebar:
+    # 0. MODIFICHE IN SOSPESO (fragment: controlla il debounce senza interazioni)
+    if get_pending(): st.fragment(box_pending, run_every=5)()
+    
     # 1. CALCOLO DATI
-    lvl, tot_xp, prog, curr_xp = calculate_user_level(df)
+    with profilo.misura("calculate_user_level"): lvl, tot_xp, prog, curr_xp = calculate_user_level(get_conteggi())
     
     # 2. SEZIONE PROFILO (Semplificata)
     url_avatar = user_settings.get('url_foto', '').strip()
@@ -280,7 +631,7 @@ with st.sidebar:
             tf = st.number_input("Target Fat", value=int(user_settings['target_fat']))
             if st.form_submit_button("Salva"):
                 ns = user_settings.copy(); ns.update({"target_cal":tc,"target_pro":tp,"target_carb":tca,"target_fat":tf})
-                add_riga_diario("settings", ns, data_filtro); st.rerun()
+                save_user_settings(ns); st.rerun()
 
     st.markdown("---")
     with st.expander("📸 Cambia Foto"):
@@ -288,27 +639,29 @@ with st.sidebar:
         if st.button("Salva", key="s_btn"):
             if nu:
                 ns = user_settings.copy(); ns['url_foto'] = nu
-                add_riga_diario("settings", ns, data_filtro); st.rerun()
+                save_user_settings(ns); st.rerun()
 
     st.markdown("---")
     w_fast = st.number_input("Peso Rapido (kg)", 0.0, format="%.1f", key="side_w_f")
     if st.button("Salva Peso", key="side_btn_w"):
         if w_fast > 0:
             add_riga_diario("misure", {"peso": w_fast}, data_filtro)
-            st.toast("Salvato!"); st.rerun()
+            notifica("Salvato!"); st.rerun()
 
     st.markdown("---")
     q_ai = st.text_input("Coach AI...", key="s_ai")
     if st.button("Invia", key="s_aibtn"):
-        if "chat" not in st.session_state: st.session_state.chat = []
+        if "chat" not in st.session_state: st.session_state.chat = deque(maxlen=CHAT_MAX)
         st.session_state.chat.append({"role":"user","txt":q_ai})
-        ans="Errore AI"; 
-        if gemini_ok:
-            try: ans=model.generate_content(f"Sei un PT esperto. Sii breve e motivante. Rispondi: {q_ai}").text
-            except: pass
-        st.session_state.chat.append({"role":"assistant","txt":ans}); st.rerun()
+        coach = get_coach()
+        job = coach.chiedi(q_ai) if coach else None
+        # La risposta arriva in background: la pagina non aspetta il modello
+        if job and not job.finito: st.session_state.coach_job = job
+        else: st.session_state.chat.append({"role":"assistant","txt":job.testo if job else "Errore AI"})
     
-    if "chat" in st.session_state and st.session_state.chat:
+    if "coach_job" in st.session_state:
+        st.fragment(box_coach, run_every=0.5)()
+    elif "chat" in st.session_state and st.session_state.chat:
         st.info(st.session_state.chat[-1]['txt'])
 
 # ==========================================
@@ -347,46 +700,37 @@ st.write("")
 # ==========================================
 # 📊 PREPARAZIONE DATI GLOBALI (Mancava questo pezzo!)
 # ==========================================
-misure_list = []
-if not df.empty:
-    for _, r in df.iterrows():
-        if r['tipo'] == 'misure':
-            try:
-                # Usiamo la funzione safe_parse_json definita in alto
-                d = safe_parse_json(r['dettaglio_json'])
-                if d and 'peso' in d:
-                    misure_list.append({"Data": r['data'], "Peso": float(d['peso'])})
-            except: pass
+norm = get_diario_norm()
+pend_diario = righe_pending_diario()
+# UI ottimistica: le righe in sospeso compaiono subito
+if len(pend_diario): norm = aggiorna_norm(norm, pend_diario)
+ids_pending = set(pend_diario["id"]) if len(pend_diario) else set()
 
 
-tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Dashboard", "🍎 Alimentazione", "🏋️ Workout", "📏 Storico", "🤸 Calisthenics"])
+# Navigazione lazy: gira solo la sezione scelta (e legge solo i fogli che le servono)
+SEZIONI = ["📊 Dashboard", "🍎 Alimentazione", "🏋️ Workout", "📏 Storico", "🤸 Calisthenics"]
+# Un click sul segmento attivo lo deselezionerebbe: si rimette l'ultima sezione, così resta evidenziata
+if st.session_state.get("sezione") is None: st.session_state["sezione"] = st.session_state.get("sezione_ultima", SEZIONI[0])
+sezione = st.segmented_control("Sezione", SEZIONI, key="sezione", label_visibility="collapsed")
+st.session_state["sezione_ultima"] = sezione
 
 # --- TAB 1: DASHBOARD (CODICE AGGIORNATO v14.5) ---
-with tab1:
+if sezione == SEZIONI[0]:
+    # Data in un anno archiviato: la partizione di quell'anno si legge solo adesso
+    norm_caldo, norm = norm, con_archivio(norm, data_filtro)
     # 1. Recupero dati giornalieri
-    df_oggi = df[df['data'] == data_filtro] if not df.empty else pd.DataFrame()
+    pasti_oggi = fetta(norm["pasti"], data_filtro)
     
-    cal = pro = carb = fat = 0
+    with profilo.misura("tab1:aggregazione"):
+        agg = aggrega(norm, data_filtro, data_filtro) if len(pend_diario) or norm is not norm_caldo else get_aggregati()
+        riepilogo = riepilogo_giorno(agg, data_filtro)
+    cal, pro, carb, fat = (riepilogo[k] for k in ["cal", "pro", "carb", "fat"])
     meal_groups = {"Colazione": [], "Pranzo": [], "Cena": [], "Spuntino": [], "Integrazione": []}
-    allenamenti = []
-    water_today = 0
+    for d in pasti_oggi.reset_index().to_dict("records"):
+        cat = d['pasto'] if d['pasto'] in meal_groups else "Spuntino"
+        meal_groups[cat].append(d)
     
-    if not df_oggi.empty:
-        for i, r in df_oggi.iterrows():
-            try:
-                d = json.loads(r['dettaglio_json']) # O usa safe_parse_json se l'hai definita
-                d['idx'] = i 
-                
-                if r['tipo'] == 'pasto':
-                    cal += d.get('cal',0); pro += d.get('pro',0); carb += d.get('carb',0); fat += d.get('fat',0)
-                    cat = d.get('pasto', 'Spuntino')
-                    if cat in meal_groups: meal_groups[cat].append(d)
-                    else: meal_groups["Spuntino"].append(d)
-                elif r['tipo'] == 'allenamento':
-                    allenamenti.append(d)
-                elif r['tipo'] == 'acqua':
-                    water_today += d.get('ml', 0)
-            except: pass
+    allenamenti = fetta(norm["allenamenti"], data_filtro).reset_index().to_dict("records")
 
     # 2. LOGICA HERO SECTION (Sostituisce Altair)
     TC = user_settings['target_cal']
@@ -434,22 +778,28 @@ with tab1:
             st.progress(prog_p)
             
     # COLONNA 3: IDRATAZIONE
-    with c_hero_3:
+    # Fragment: il ➕ riesegue solo questa card, non l'intero script
+    @st.fragment
+    def card_acqua(giorno):
+        t0 = time.perf_counter()
         with st.container(border=True):
             st.markdown("**💧 Acqua**")
             cw1, cw2 = st.columns([1, 2])
             with cw1:
                 # Pulsante rapido
                 if st.button("➕", key="btn_w_quick", help="Aggiungi 250ml"):
-                    add_riga_diario("acqua", {"ml": 250}) # Assicurati che add_riga_diario supporti 'acqua'
-                    st.toast("Idratazione +250ml")
-                    time.sleep(0.5)
-                    st.rerun()
+                    add_riga_diario("acqua", {"ml": 250})
+                    st.toast("Idratazione +250ml", icon="💧")
+            # Letto dopo il click: la cache del diario è già aggiornata con la nuova riga
+            water_today = fetta(con_archivio(get_diario_norm(), giorno)["acqua"], giorno)["ml"].sum()
             with cw2:
                 st.caption(f"{int(water_today)} / 2500 ml")
             
             prog_w = min(water_today / 2500, 1.0)
             st.progress(prog_w)
+        registra_tempo("acqua", t0)
+
+    with c_hero_3: card_acqua(data_filtro)
 
     st.markdown("---")
     
@@ -474,10 +824,7 @@ with tab1:
     today = datetime.date.today()
     last_7 = [today - datetime.timedelta(days=i) for i in range(6, -1, -1)]
     
-    active_dates = set()
-    if not df.empty:
-        workout_days = df[df['tipo'] == 'allenamento']['data'].tolist()
-        active_dates = set(workout_days)
+    active_dates = set(fetta(norm["allenamenti"], last_7[0], today)["data"].dt.strftime("%Y-%m-%d"))
 
     cols = st.columns(7)
     for idx, day in enumerate(last_7):
@@ -499,25 +846,29 @@ with tab1:
     st.markdown("---")
     st.subheader("📉 Andamento Peso")
 
-    if misure_list:
-        df_w = pd.DataFrame(misure_list)
-        df_w['Data'] = pd.to_datetime(df_w['Data'])
-        df_w = df_w.sort_values('Data')
-
-        chart_w = alt.Chart(df_w).mark_line(
-            point=True, color='#0051FF', strokeWidth=3
-        ).encode(
-            x=alt.X('Data:T', axis=alt.Axis(format='%d/%m', title='', tickCount=5)),
-            y=alt.Y('Peso:Q', scale=alt.Scale(zero=False, padding=10), title='Kg'),
-            tooltip=[alt.Tooltip('Data:T', format='%d %B'), alt.Tooltip('Peso:Q')]
-        ).properties(height=250, background='transparent')
+    # Misure non ancora salvate: serie ricalcolata al volo, altrimenti quella in cache
+    serie_w = serie_peso(misure_peso(norm_caldo)) if len(pend_diario) and (pend_diario["tipo"] == "misure").any() else get_serie_peso()
+    if not serie_w.empty:
+        finestra = st.radio("Periodo", list(FINESTRE), index=len(FINESTRE) - 1, horizontal=True, key="peso_range", label_visibility="collapsed")
+        with profilo.misura("tab1:grafico_peso"):
+            # Al massimo ~150 punti per finestra (LTTB), il trend EWMA sugli stessi giorni
+            df_w = punti_grafico(serie_w, finestra)[["data", "peso", "trend"]]
+            base_w = alt.Chart(df_w).encode(
+                x=alt.X('data:T', axis=alt.Axis(format='%d/%m', title='', tickCount=5)),
+                tooltip=[alt.Tooltip('data:T', format='%d %B', title='Data'), alt.Tooltip('peso:Q', title='Peso'),
+                         alt.Tooltip('trend:Q', format='.1f', title='Trend')]
+            )
+            chart_w = base_w.mark_line(point=True, color='#0051FF', strokeWidth=3).encode(
+                y=alt.Y('peso:Q', scale=alt.Scale(zero=False, padding=10), title='Kg')
+            ) + base_w.mark_line(color='#FF8A00', strokeWidth=2, strokeDash=[6, 3]).encode(y='trend:Q')
 
         with st.container(border=True):
-            st.altair_chart(chart_w.interactive(), use_container_width=True)
-            if len(df_w) >= 2:
-                delta = df_w.iloc[-1]['Peso'] - df_w.iloc[-2]['Peso']
-                sym = "⬆" if delta > 0 else "⬇"
-                st.caption(f"Variazione: **{sym} {abs(delta):.1f} kg** rispetto alla pesata precedente.")
+            with profilo.misura("tab1:grafico_peso:render"):
+                st.altair_chart(chart_w.properties(height=250, background='transparent').interactive(), use_container_width=True)
+            var = variazione(serie_w)
+            if var:
+                sym = "⬆" if var["delta"] > 0 else "⬇"
+                st.caption(f"Variazione: **{sym} {abs(var['delta']):.1f} kg** rispetto alla pesata precedente · trend **{var['kg_sett']:+.2f} kg/settimana**.")
     else:
         st.info("Nessuna misurazione trovata.")
 
@@ -531,16 +882,16 @@ with tab1:
             items = meal_groups[cat]
             if items:
                 found_meals = True
-                sub_cal = sum(x['cal'] for x in items)
+                sub_cal = riepilogo["cal_per_pasto"][cat]
                 with st.expander(f"**{cat}** • {int(sub_cal)} kcal", expanded=True):
                     for p in items:
                         r1, r2, r3 = st.columns([3, 2, 1])
                         qty = f"{int(p.get('gr',0))}{p.get('unita','g')}"
                         r1.markdown(f"**{p['nome']}**")
-                        r1.caption(qty)
+                        r1.caption(qty + (" · ⏳ non salvato" if p['id'] in ids_pending else ""))
                         r2.markdown(f"<small>P:{int(p['pro'])} C:{int(p['carb'])} F:{int(p['fat'])}</small>", unsafe_allow_html=True)
-                        if r3.button("🗑️", key=f"del_p_{p['idx']}"): 
-                            delete_riga(p['idx']); st.rerun()
+                        if r3.button("🗑️", key=f"del_p_{p['id']}"): 
+                            delete_riga(p['id'], norm); st.rerun()
         if not found_meals: st.info("Nessun pasto registrato oggi.")
 
     # --- TAB 1 ---
@@ -551,8 +902,8 @@ with tab1:
                 with st.container(border=True):
                     h1, h2 = st.columns([4,1])
                     h1.markdown(f"**{w.get('nome_sessione','Workout')}**")
-                    h1.caption(f"⏱️ {w['durata']} min")
-                    if h2.button("✖️", key=f"del_w_{w['idx']}"): delete_riga(w['idx']); st.rerun()
+                    h1.caption(f"⏱️ {int(w['durata'])} min")
+                    if h2.button("✖️", key=f"del_w_{w['id']}"): delete_riga(w['id'], norm); st.rerun()
                     if 'esercizi' in w and w['esercizi']:
                         for ex in w['esercizi']:
                             t = ex.get('type', 'pesi')
@@ -576,13 +927,12 @@ with tab1:
         else: st.info("Riposo o nessun dato.")
 
 # --- TAB 2: ALIMENTAZIONE ---
-with tab2:
+if sezione == SEZIONI[1]:
     c_in, c_db = st.columns([2,1])
     
     df_cibi = get_data("cibi")
-    nomi_cibi = df_cibi['nome'].tolist() if not df_cibi.empty else []
-    df_int = get_data("integratori")
-    nomi_int = df_int['nome'].tolist() if not df_int.empty else []
+    idx_cibi = get_indice("cibi")
+    idx_int = get_indice("integratori")
 
     with c_in:
         st.subheader("Inserimento")
@@ -602,18 +952,64 @@ with tab2:
             st.session_state['fc'] = base['c'] * factor
             st.session_state['ff'] = base['f'] * factor
 
+        # Fragment: ricerca, quantità (f_gr -> update_macro_values) e macro ricalcolano solo il form
+        @st.fragment
+        def form_cibo(cat):
+            t0 = time.perf_counter()
+            with st.container(border=True):
+                q_f = st.text_input("🔍 Cerca Cibo", key="q_food", placeholder="Scrivi per cercare...")
+                sel = st.selectbox("Risultati", ["-- Manuale --"] + idx_cibi.cerca(q_f), key="f_sel")
+
+                # Logica cambio selezione (lookup hash nome -> macro)
+                if "last_sel_food" not in st.session_state: st.session_state.last_sel_food = None
+                if sel != st.session_state.last_sel_food:
+                    st.session_state.last_sel_food = sel
+                    macro = idx_cibi.get(sel)
+                    if macro:
+                        st.session_state['f_nm'] = sel
+                        st.session_state['base_food'] = macro
+                        # Se l'utente seleziona un cibo nuovo e c'è già una quantità, ricalcola subito
+                        if st.session_state.get('f_gr', 0) > 0:
+                            update_macro_values()
+
+                c1, c2 = st.columns([2,1])
+                nom = c1.text_input("Nome Alimento", key="f_nm")
+
+                # AGGIUNTO: on_change=update_macro_values
+                # Questo attiva il ricalcolo immediato quando cambi il numero e premi Invio o clicchi fuori
+                gr = c2.number_input("Quantità (g)", step=10.0, key="f_gr", on_change=update_macro_values)
+
+                st.markdown("###### 📊 Valori Nutrizionali")
+                m1,m2,m3,m4 = st.columns(4)
+
+                # I campi qui sotto ora leggono direttamente dallo stato aggiornato dalla callback
+                k=m1.number_input("Kcal", key="fk")
+                p=m2.number_input("Pro", key="fp")
+                c=m3.number_input("Carb", key="fc")
+                f=m4.number_input("Fat", key="ff")
+
+                st.write("")
+                if st.button("🍽️ Aggiungi al Diario", type="primary", use_container_width=True, key="bf"):
+                    if nom: 
+                        accoda_diario("pasto",{"pasto":cat,"nome":nom,"gr":gr,"unita":"g","cal":k,"pro":p,"carb":c,"fat":f}, data_filtro)
+                        notifica("Pasto aggiunto!", "🍽️")
+                        # Pulizia campi
+                        clear_form_state(["f_nm", "f_gr", "fk", "fp", "fc", "ff"])
+                        st.rerun()
+            registra_tempo("form_cibo", t0)
+
         if cat == "Integrazione":
             # === INTEGRATORE (LOGICA ESISTENTE) ===
-            sel_i = st.selectbox("Cerca Integratore", ["-- Manuale --"] + nomi_int, key="search_int")
+            # Top-k dall'indice invece dell'intero catalogo nel widget
+            q_i = st.text_input("🔍 Cerca Integratore", key="q_int", placeholder="Scrivi per cercare...")
+            sel_i = st.selectbox("Risultati", ["-- Manuale --"] + idx_int.cerca(q_i), key="search_int")
             if "last_sel_int" not in st.session_state: st.session_state.last_sel_int = None
             if sel_i != st.session_state.last_sel_int:
                 st.session_state.last_sel_int = sel_i
-                if sel_i != "-- Manuale --" and not df_int.empty:
-                    try:
-                        row = df_int[df_int['nome'] == sel_i].iloc[0]
-                        st.session_state['i_nm'] = str(row['nome']) 
-                        st.session_state['base_int'] = {'k': row['kcal'], 'p': row['pro'], 'c': row['carb'], 'f': row['fat']}
-                    except: pass
+                macro = idx_int.get(sel_i)
+                if macro:
+                    st.session_state['i_nm'] = sel_i
+                    st.session_state['base_int'] = macro
                 else: st.session_state['base_int'] = {'k':0,'p':0,'c':0,'f':0}
 
             base = st.session_state.get('base_int', {'k':0,'p':0,'c':0,'f':0})
@@ -631,53 +1027,13 @@ with tab2:
 
                 if st.button("Aggiungi", type="primary", use_container_width=True, key="bi"):
                     if nom: 
-                        add_riga_diario("pasto",{"pasto":cat,"nome":nom,"gr":q,"unita":u,"cal":val_k,"pro":val_p,"carb":val_c,"fat":val_f}, data_filtro)
+                        accoda_diario("pasto",{"pasto":cat,"nome":nom,"gr":q,"unita":u,"cal":val_k,"pro":val_p,"carb":val_c,"fat":val_f}, data_filtro)
                         clear_form_state(["i_nm", "i_q"])
                         st.rerun()
         else:
             # === CIBO NORMALE (CORRETTO CON CALLBACK) ===
             st.info("💡 Compila i dati qui sotto per aggiungere un pasto.")
-            with st.container(border=True):
-                sel = st.selectbox("🔍 Cerca Cibo", ["-- Manuale --"]+nomi_cibi, key="f_sel")
-                
-                # Logica cambio selezione
-                if "last_sel_food" not in st.session_state: st.session_state.last_sel_food = None
-                if sel != st.session_state.last_sel_food:
-                    st.session_state.last_sel_food = sel
-                    if sel != "-- Manuale --" and not df_cibi.empty:
-                        try:
-                            row = df_cibi[df_cibi['nome'] == sel].iloc[0]
-                            st.session_state['f_nm'] = str(row['nome']) 
-                            st.session_state['base_food'] = {'k': row['kcal'], 'p': row['pro'], 'c': row['carb'], 'f': row['fat']}
-                            # Se l'utente seleziona un cibo nuovo e c'è già una quantità, ricalcola subito
-                            if st.session_state.get('f_gr', 0) > 0:
-                                update_macro_values()
-                        except: pass
-                
-                c1, c2 = st.columns([2,1])
-                nom = c1.text_input("Nome Alimento", key="f_nm")
-                
-                # AGGIUNTO: on_change=update_macro_values
-                # Questo attiva il ricalcolo immediato quando cambi il numero e premi Invio o clicchi fuori
-                gr = c2.number_input("Quantità (g)", step=10.0, key="f_gr", on_change=update_macro_values)
-                
-                st.markdown("###### 📊 Valori Nutrizionali")
-                m1,m2,m3,m4 = st.columns(4)
-                
-                # I campi qui sotto ora leggono direttamente dallo stato aggiornato dalla callback
-                k=m1.number_input("Kcal", key="fk")
-                p=m2.number_input("Pro", key="fp")
-                c=m3.number_input("Carb", key="fc")
-                f=m4.number_input("Fat", key="ff")
-                
-                st.write("")
-                if st.button("🍽️ Aggiungi al Diario", type="primary", use_container_width=True, key="bf"):
-                    if nom: 
-                        add_riga_diario("pasto",{"pasto":cat,"nome":nom,"gr":gr,"unita":"g","cal":k,"pro":p,"carb":c,"fat":f}, data_filtro)
-                        st.success("Pasto aggiunto!")
-                        # Pulizia campi
-                        clear_form_state(["f_nm", "f_gr", "fk", "fp", "fc", "ff"])
-                        st.rerun()
+            form_cibo(cat)
 
     with c_db:
         st.subheader("💾 Gestione DB")
@@ -686,9 +1042,6 @@ with tab2:
         # RICORDA DI NON CANCELLARE LA PARTE DI DESTRA SE NON VUOI REINCOLLARLA.
         # Per sicurezza, reincollo la logica DB qui sotto per completezza del blocco TAB 2.
         
-        df_ex_gestione = get_data("esercizi") 
-        if df_ex_gestione.empty: df_ex_gestione = pd.DataFrame(columns=["nome", "categoria"])
-
         t_cibo, t_int, t_ex = st.tabs(["Cibo", "Int", "Ex"])
         
         with t_cibo:
@@ -699,12 +1052,14 @@ with tab2:
                 c=r1.number_input("C", key="dbc"); f=r2.number_input("F", key="dbf")
                 if st.form_submit_button("Salva"):
                     if n: 
-                        save_data("cibi", pd.concat([df_cibi, pd.DataFrame([{"nome":n,"kcal":k,"pro":p,"carb":c,"fat":f}])], ignore_index=True))
+                        accoda("cibi", {"nome":n,"kcal":k,"pro":p,"carb":c,"fat":f})
                         st.rerun()
             
             with st.expander("🗑️ Elimina Cibi"):
                 if not df_cibi.empty:
-                    to_del = st.multiselect("Seleziona", df_cibi['nome'].tolist(), key="del_food_m")
+                    q_del = st.text_input("Filtra", key="q_del_food")
+                    opts = list(dict.fromkeys(st.session_state.get("del_food_m", []) + idx_cibi.cerca(q_del, 50)))
+                    to_del = st.multiselect("Seleziona", opts, key="del_food_m")
                     if st.button("Elimina", key="btn_del_f"):
                         save_data("cibi", df_cibi[~df_cibi['nome'].isin(to_del)])
                         st.rerun()
@@ -717,7 +1072,7 @@ with tab2:
                 ci=r1.number_input("C", key="dbi_c"); fi=r2.number_input("F", key="dbi_f")
                 if st.form_submit_button("Salva"):
                     if ni: 
-                        save_data("integratori", pd.concat([df_int, pd.DataFrame([{"nome":ni,"tipo":"g","kcal":ki,"pro":pi,"carb":ci,"fat":fi}])], ignore_index=True))
+                        accoda("integratori", {"nome":ni,"tipo":"g","kcal":ki,"pro":pi,"carb":ci,"fat":fi})
                         st.rerun()
 
         with t_ex:
@@ -728,140 +1083,210 @@ with tab2:
                 if bulk_text:
                     lista = [x.strip() for x in bulk_text.split('\n') if x.strip()]
                     if lista:
-                        new_rows = pd.DataFrame({'nome': lista, 'categoria': cat_bulk})
-                        save_data("esercizi", pd.concat([df_ex_gestione, new_rows], ignore_index=True))
+                        for nome_ex in lista: accoda("esercizi", {'nome': nome_ex, 'categoria': cat_bulk})
                         st.rerun()
 
 # --- TAB 3: WORKOUT (AGGIORNATO CON ZAVORRA PER ISO E ABS) ---
-with tab3:
+if sezione == SEZIONI[2]:
     st.subheader("Workout")
-    df_ex = get_data("esercizi")
-    if df_ex.empty: df_ex = pd.DataFrame(columns=["nome", "categoria"])
-    elif "categoria" not in df_ex.columns: df_ex["categoria"] = "Pesi"
-    
-    # 1. Caricamento Liste per Categoria
-    ls_pesi = sorted(df_ex[df_ex['categoria'] == 'Pesi']['nome'].unique().tolist())
-    ls_cali = sorted(df_ex[df_ex['categoria'] == 'Calisthenics']['nome'].unique().tolist())
-    ls_iso  = sorted(df_ex[df_ex['categoria'] == 'Isometria']['nome'].unique().tolist())
-    ls_abs  = sorted(df_ex[df_ex['categoria'] == 'Abs']['nome'].unique().tolist())
+    # 1. Liste per Categoria (calcolate una volta per versione del foglio esercizi)
+    ex = get_esercizi()
+    ls_pesi, ls_cali, ls_iso, ls_abs = ex["Pesi"], ex["Calisthenics"], ex["Isometria"], ex["Abs"]
     
     if 'sess_w' not in st.session_state: st.session_state['sess_w'] = []
     
-    c1, c2 = st.columns([1,2])
-    with c1:
-        st.caption("Setup Sessione")
-        ses = st.text_input("Nome Sessione", "Workout", key="w_ses")
-        mod = st.radio("Modo", ["Pesi", "Calisthenics", "Isometria", "Abs", "Cardio"], horizontal=True, key="w_mod")
+    # Fragment: aggiungere/togliere set riesegue solo il builder della sessione
+    @st.fragment
+    def sessione_workout():
+        t0 = time.perf_counter()
+        c1, c2 = st.columns([1,2])
+        with c1:
+            st.caption("Setup Sessione")
+            ses = st.text_input("Nome Sessione", "Workout", key="w_ses")
+            mod = st.radio("Modo", ["Pesi", "Calisthenics", "Isometria", "Abs", "Cardio"], horizontal=True, key="w_mod")
         
-        # --- MODO PESI ---
-        if mod == "Pesi":
-            def clear_w_in(): 
-                if 'ws' in st.session_state: st.session_state.ws = 1
-                if 'ww' in st.session_state: st.session_state.ww = 0.0
-
-            sl = st.selectbox("Esercizio", ["-- Nuovo --"] + ls_pesi, key="w_sl", on_change=clear_w_in)
-            nm = st.text_input("Nome", key="w_nm") if sl == "-- Nuovo --" else sl
-            s=st.number_input("Set",1,key="ws"); r=st.number_input("Rep",1,key="wr"); w=st.number_input("Kg",0.0,key="ww")
-            if st.button("Aggiungi Set", key="wb"): 
-                st.session_state['sess_w'].append({"type":"pesi","nome":nm,"serie":s,"reps":r,"kg":w})
+            # --- MODO PESI ---
+            if mod == "Pesi":
+                def clear_w_in(): 
+                    if 'ws' in st.session_state: st.session_state.ws = 1
+                    if 'ww' in st.session_state: st.session_state.ww = 0.0
+
+                sl = st.selectbox("Esercizio", ["-- Nuovo --", *ls_pesi], key="w_sl", on_change=clear_w_in)
+                nm = st.text_input("Nome", key="w_nm") if sl == "-- Nuovo --" else sl
+                s=st.number_input("Set",1,key="ws"); r=st.number_input("Rep",1,key="wr"); w=st.number_input("Kg",0.0,key="ww")
+                box_pr(nm, "pesi", w)
+                if st.button("Aggiungi Set", key="wb"): 
+                    st.session_state['sess_w'].append({"type":"pesi","nome":nm,"serie":s,"reps":r,"kg":w})
             
-            with st.expander("Salva nel DB"):
-                if st.button("Salva Pesi", key="wds"): 
-                    save_data("esercizi", pd.concat([df_ex, pd.DataFrame([{"nome":nm, "categoria":"Pesi"}])], ignore_index=True))
-                    st.rerun()
+                with st.expander("Salva nel DB"):
+                    if st.button("Salva Pesi", key="wds"): 
+                        accoda("esercizi", {"nome":nm, "categoria":"Pesi"})
+                        st.rerun()
 
-        # --- MODO CALISTHENICS ---
-        elif mod == "Calisthenics":
-            sl = st.selectbox("Esercizio", ["-- Nuovo --"] + ls_cali, key="w_cali_sl")
-            nm = st.text_input("Nome", key="w_cali_nm") if sl == "-- Nuovo --" else sl
-            s = st.number_input("Set", 1, key="wcs"); r = st.number_input("Rep", 1, key="wcr"); w = st.number_input("Kg", 0.0, key="wcw")
-            if st.button("Aggiungi Set", key="w_cali_b"): 
-                st.session_state['sess_w'].append({"type":"calisthenics","nome":nm,"serie":s,"reps":r,"kg":w})
-
-        # --- MODO ISOMETRIA (UPDATED: CON ZAVORRA) ---
-        elif mod == "Isometria":
-            sl = st.selectbox("Esercizio", ["-- Nuovo --"] + ls_iso, key="w_iso_sl")
-            nm = st.text_input("Nome", key="w_iso_nm") if sl == "-- Nuovo --" else sl
+            # --- MODO CALISTHENICS ---
+            elif mod == "Calisthenics":
+                sl = st.selectbox("Esercizio", ["-- Nuovo --", *ls_cali], key="w_cali_sl")
+                nm = st.text_input("Nome", key="w_cali_nm") if sl == "-- Nuovo --" else sl
+                s = st.number_input("Set", 1, key="wcs"); r = st.number_input("Rep", 1, key="wcr"); w = st.number_input("Kg", 0.0, key="wcw")
+                box_pr(nm, "calisthenics", w)
+                if st.button("Aggiungi Set", key="w_cali_b"): 
+                    st.session_state['sess_w'].append({"type":"calisthenics","nome":nm,"serie":s,"reps":r,"kg":w})
+
+            # --- MODO ISOMETRIA (UPDATED: CON ZAVORRA) ---
+            elif mod == "Isometria":
+                sl = st.selectbox("Esercizio", ["-- Nuovo --", *ls_iso], key="w_iso_sl")
+                nm = st.text_input("Nome", key="w_iso_nm") if sl == "-- Nuovo --" else sl
             
-            c_i1, c_i2, c_i3 = st.columns(3)
-            s = c_i1.number_input("Set", 1, key="wis")
-            t = c_i2.number_input("Sec", 10, step=5, key="wit")
-            z = c_i3.number_input("Kg", 0.0, step=0.5, key="wiz") # Zavorra
+                c_i1, c_i2, c_i3 = st.columns(3)
+                s = c_i1.number_input("Set", 1, key="wis")
+                t = c_i2.number_input("Sec", 10, step=5, key="wit")
+                z = c_i3.number_input("Kg", 0.0, step=0.5, key="wiz") # Zavorra
+                box_pr(nm, "isometria")
             
-            if st.button("Aggiungi Iso", key="w_iso_b"): 
-                st.session_state['sess_w'].append({"type":"isometria","nome":nm,"serie":s,"tempo":t,"kg":z})
+                if st.button("Aggiungi Iso", key="w_iso_b"): 
+                    st.session_state['sess_w'].append({"type":"isometria","nome":nm,"serie":s,"tempo":t,"kg":z})
             
-            with st.expander("Salva nel DB"):
-                if st.button("Salva Iso", key="wds_iso"): 
-                    save_data("esercizi", pd.concat([df_ex, pd.DataFrame([{"nome":nm, "categoria":"Isometria"}])], ignore_index=True))
-                    st.rerun()
+                with st.expander("Salva nel DB"):
+                    if st.button("Salva Iso", key="wds_iso"): 
+                        accoda("esercizi", {"nome":nm, "categoria":"Isometria"})
+                        st.rerun()
 
-        # --- MODO ABS (UPDATED: CON ZAVORRA) ---
-        elif mod == "Abs":
-            sl = st.selectbox("Esercizio", ["-- Nuovo --"] + ls_abs, key="w_abs_sl")
-            nm = st.text_input("Nome", key="w_abs_nm") if sl == "-- Nuovo --" else sl
+            # --- MODO ABS (UPDATED: CON ZAVORRA) ---
+            elif mod == "Abs":
+                sl = st.selectbox("Esercizio", ["-- Nuovo --", *ls_abs], key="w_abs_sl")
+                nm = st.text_input("Nome", key="w_abs_nm") if sl == "-- Nuovo --" else sl
             
-            c_a1, c_a2, c_a3 = st.columns(3)
-            s = c_a1.number_input("Set", 3, key="was")
-            r = c_a2.number_input("Reps", 15, step=5, key="war")
-            z = c_a3.number_input("Kg", 0.0, step=1.0, key="waz") # Zavorra
+                c_a1, c_a2, c_a3 = st.columns(3)
+                s = c_a1.number_input("Set", 3, key="was")
+                r = c_a2.number_input("Reps", 15, step=5, key="war")
+                z = c_a3.number_input("Kg", 0.0, step=1.0, key="waz") # Zavorra
+                box_pr(nm, "abs", z)
             
-            if st.button("Aggiungi Abs", key="w_abs_b"): 
-                st.session_state['sess_w'].append({"type":"abs","nome":nm,"serie":s,"reps":r,"kg":z})
+                if st.button("Aggiungi Abs", key="w_abs_b"): 
+                    st.session_state['sess_w'].append({"type":"abs","nome":nm,"serie":s,"reps":r,"kg":z})
             
-            with st.expander("Salva nel DB"):
-                if st.button("Salva Abs", key="wds_abs"): 
-                    save_data("esercizi", pd.concat([df_ex, pd.DataFrame([{"nome":nm, "categoria":"Abs"}])], ignore_index=True))
-                    st.rerun()
+                with st.expander("Salva nel DB"):
+                    if st.button("Salva Abs", key="wds_abs"): 
+                        accoda("esercizi", {"nome":nm, "categoria":"Abs"})
+                        st.rerun()
 
-        # --- MODO CARDIO ---
-        else: 
-            nm = st.text_input("Nome", "Corsa", key="ca_nm")
-            km=st.number_input("Km",0.0,key="ck"); mi=st.number_input("Min",0,key="cm"); kc=st.number_input("Kcal",0,key="cc")
-            if st.button("Aggiungi Cardio", key="cb"): 
-                st.session_state['sess_w'].append({"type":"cardio","nome":nm,"km":km,"tempo":mi,"kcal":kc})
-
-    with c2:
-        st.subheader(f"In Corso: {ses}")
-        if st.session_state['sess_w']:
-            for i,e in enumerate(st.session_state['sess_w']):
-                # --- LOGICA DISPLAY SESSIONE AGGIORNATA ---
-                typ = e.get('type', 'pesi')
-                kg_val = e.get('kg', 0)
-                zavorra_str = f" +{kg_val}kg" if kg_val > 0 else ""
-
-                if typ == 'cardio': 
-                    det = f"{e.get('km')}km in {e.get('tempo')}min"
-                elif typ == 'isometria':
-                    det = f"{e.get('serie')} set x {e.get('tempo')}s{zavorra_str}"
-                elif typ == 'abs':
-                    det = f"{e.get('serie')} set x {e.get('reps')} reps{zavorra_str}"
-                else: # Pesi e Calisthenics
-                    det = f"{e.get('serie',0)}x{e.get('reps',0)} @ {kg_val}kg"
+            # --- MODO CARDIO ---
+            else: 
+                nm = st.text_input("Nome", "Corsa", key="ca_nm")
+                km=st.number_input("Km",0.0,key="ck"); mi=st.number_input("Min",0,key="cm"); kc=st.number_input("Kcal",0,key="cc")
+                box_pr(nm, "cardio")
+                if st.button("Aggiungi Cardio", key="cb"): 
+                    st.session_state['sess_w'].append({"type":"cardio","nome":nm,"km":km,"tempo":mi,"kcal":kc})
+
+        with c2:
+            st.subheader(f"In Corso: {ses}")
+            if st.session_state['sess_w']:
+                for i,e in enumerate(st.session_state['sess_w']):
+                    # --- LOGICA DISPLAY SESSIONE AGGIORNATA ---
+                    typ = e.get('type', 'pesi')
+                    kg_val = e.get('kg', 0)
+                    zavorra_str = f" +{kg_val}kg" if kg_val > 0 else ""
+
+                    if typ == 'cardio': 
+                        det = f"{e.get('km')}km in {e.get('tempo')}min"
+                    elif typ == 'isometria':
+                        det = f"{e.get('serie')} set x {e.get('tempo')}s{zavorra_str}"
+                    elif typ == 'abs':
+                        det = f"{e.get('serie')} set x {e.get('reps')} reps{zavorra_str}"
+                    else: # Pesi e Calisthenics
+                        det = f"{e.get('serie',0)}x{e.get('reps',0)} @ {kg_val}kg"
                 
-                c_txt, c_del = st.columns([5,1])
-                c_txt.markdown(f"**{e['nome']}** : {det}")
-                if c_del.button("❌", key=f"del_w_sess_{i}"): 
-                    st.session_state['sess_w'].pop(i)
-                    st.rerun()
+                    c_txt, c_del = st.columns([5,1])
+                    c_txt.markdown(f"**{e['nome']}** : {det}")
+                    # Callback: il set sparisce già in questo rerun del fragment
+                    c_del.button("❌", key=f"del_w_sess_{i}", on_click=st.session_state['sess_w'].pop, args=(i,))
             
-            st.divider()
-            du = st.number_input("Durata (min)", 0, step=5, key="wdur")
+                st.divider()
+                du = st.number_input("Durata (min)", 0, step=5, key="wdur")
             
-            if st.button("TERMINA & SALVA", type="primary", use_container_width=True):
-                add_riga_diario("allenamento",{"nome_sessione":ses,"durata":du,"esercizi":st.session_state['sess_w']}, data_filtro)
-                st.session_state['sess_w'] = []
-                st.toast("Workout Salvato! 💪", icon="🔥")
-                time.sleep(1.5) 
-                st.rerun()
-        else: 
-            st.info("Aggiungi il primo esercizio.")
+                if st.button("TERMINA & SALVA", type="primary", use_container_width=True):
+                    # Il workout chiude la sessione: commit unico insieme alle altre modifiche in sospeso
+                    accoda_diario("allenamento",{"nome_sessione":ses,"durata":du,"esercizi":st.session_state['sess_w']}, data_filtro)
+                    commit_pending()
+                    st.session_state['sess_w'] = []
+                    notifica("Workout Salvato! 💪", "🔥")
+                    st.rerun()
+            else: 
+                st.info("Aggiungi il primo esercizio.")
+        registra_tempo("sessione_workout", t0)
+
+    sessione_workout()
+
+    # Progressi: volume settimanale per categoria e andamento del singolo esercizio
+    with st.expander("📈 Progressi"):
+        with profilo.misura("tab3:analisi"):
+            tab_set = get_tabella_set()
+            if len(pend_diario): tab_set = aggiorna_set(tab_set, pend_diario)
+            riep_w = get_riepilogo()
+            if len(riep_w) and st.checkbox("Includi anni archiviati", key="prog_archivio"):
+                tab_set = pd.concat([get_set_partizione(a) for a in anni_archiviati(riep_w)] + [tab_set], ignore_index=True)
+        if tab_set.empty: st.info("Nessun allenamento registrato.")
+        else:
+            mis = st.radio("Volume", ["Serie", "Tonnellaggio", "TUT"], horizontal=True, key="prog_vol")
+            vol = volume_settimanale(tab_set, {"Serie": "serie", "Tonnellaggio": "tonnellaggio", "TUT": "tut"}[mis], settimane=12)
+            df_vol = vol.reset_index().melt("data", var_name="categoria", value_name="volume")
+            st.altair_chart(alt.Chart(df_vol).mark_bar().encode(
+                x=alt.X('data:T', axis=alt.Axis(format='%d/%m', title='')), y=alt.Y('volume:Q', title=mis),
+                color=alt.Color('categoria:N', title=''), tooltip=['data:T', 'categoria:N', 'volume:Q']
+            ).properties(height=220, background='transparent'), use_container_width=True)
+
+            ex_prog = st.selectbox("Esercizio", sorted(n for n in tab_set["nome"].unique() if n), key="prog_ex")
+            prog = progressione(tab_set, ex_prog)
+            # Pesi: massimale stimato; isometria: secondi sotto tensione; il resto: tonnellaggio
+            col = "e1rm" if prog["e1rm"].notna().any() else "tut" if prog["tut"].sum() > 0 else "tonnellaggio"
+            titolo = {"e1rm": "1RM stimato (kg)", "tut": "TUT (s)", "tonnellaggio": "Tonnellaggio (kg)"}[col]
+            if len(prog):
+                st.altair_chart(alt.Chart(prog).mark_line(point=True, color='#0051FF').encode(
+                    x=alt.X('data:T', axis=alt.Axis(format='%d/%m/%y', title='')), y=alt.Y(f'{col}:Q', scale=alt.Scale(zero=False), title=titolo),
+                    tooltip=[alt.Tooltip('data:T', format='%d %B %Y'), alt.Tooltip(f'{col}:Q', format='.1f')]
+                ).properties(height=220, background='transparent'), use_container_width=True)
 
 # --- TAB 4: STORICO ---
-with tab4:
-    if misure_list: st.dataframe(pd.DataFrame(misure_list), use_container_width=True)
+if sezione == SEZIONI[3]:
+    riep = get_riepilogo()
+    norm_s = norm
+    # Anni archiviati: le partizioni si leggono solo se richieste
+    if len(riep) and st.checkbox(f"Includi anni archiviati ({', '.join(map(str, anni_archiviati(riep)))})", key="storico_archivio"):
+        for anno in anni_archiviati(riep): norm_s = unisci_norm(norm_s, get_partizione_norm(anno))
+    df_misure = norm_s["misure"].dropna(subset=["peso"])
+    if not df_misure.empty:
+        st.dataframe(pd.DataFrame({"Data": df_misure["data"].dt.strftime("%Y-%m-%d").to_numpy(), "Peso": df_misure["peso"].to_numpy()}), use_container_width=True)
     else: st.info("Nessuna misurazione.")
     
+    with st.expander("📆 Medie Settimanali / Mensili"):
+        per = st.radio("Periodo", ["Settimana", "Mese"], horizontal=True, key="roll_per")
+        df_roll = rollup(giorni_storico(riep, get_aggregati()["giorni"]), "W" if per == "Settimana" else "MS", user_settings['target_cal'])
+        if not df_roll.empty:
+            df_roll = df_roll.sort_index(ascending=False).round(0)
+            df_roll.index = df_roll.index.strftime("%d/%m/%Y")
+            st.dataframe(df_roll.rename(columns={"cal": "Kcal", "pro": "Pro", "carb": "Carb", "fat": "Fat", "giorni": "Giorni", "aderenza": "Aderenza %"}), use_container_width=True)
+        else: st.info("Nessun pasto registrato.")
+    
+    with st.expander("📤 Esporta / 📥 Importa"):
+        ce1, ce2 = st.columns(2)
+        tab_exp = ce1.selectbox("Tabella", list(ESPORTABILI), key="exp_tab")
+        fmt_exp = ce2.radio("Formato", ["CSV", "Parquet"], horizontal=True, key="exp_fmt")
+        # Il file si genera solo al click, a blocchi, su tutto lo storico (anni archiviati compresi)
+        st.download_button("📤 Esporta", lambda: esporta_diario(tab_exp, fmt_exp), f"{tab_exp}.{fmt_exp.lower()}",
+                           "text/csv" if fmt_exp == "CSV" else "application/octet-stream", key="exp_btn", use_container_width=True)
+        st.divider()
+        tab_imp = st.selectbox("Importa in", list(ESPORTABILI), key="imp_tab", help="Stesse colonne dell'export (data obbligatoria, id facoltativo)")
+        file_imp = st.file_uploader("File CSV o Parquet", type=["csv", "parquet"], key="imp_file")
+        if file_imp is not None:
+            try: righe_imp, errori_imp = valida_import(leggi_file(file_imp.getvalue(), file_imp.name), tab_imp)
+            except Exception as e: righe_imp, errori_imp = pd.DataFrame(), [(0, f"file non leggibile: {e}")]
+            st.caption(f"✅ {len(righe_imp)} righe valide · ⚠️ {len({i for i, _ in errori_imp})} scartate")
+            if errori_imp: st.dataframe(pd.DataFrame(errori_imp[:200], columns=["Riga", "Errore"]), hide_index=True, use_container_width=True)
+            if len(righe_imp) and st.button("📥 Importa", key="imp_btn", type="primary"):
+                n_imp = importa_righe(righe_imp)
+                notifica(f"Importate {n_imp} righe ({len(righe_imp) - n_imp} già presenti)", "📥")
+                st.rerun()
+
     with st.expander("Misure Complete"):
         c1,c2 = st.columns(2)
         p=c1.number_input("Peso", key="ms_p"); a=c2.number_input("Altezza", key="ms_a")
@@ -869,11 +1294,11 @@ with tab4:
         co=c3.number_input("Collo", key="ms_co"); vi=c4.number_input("Vita", key="ms_vi"); fi=c5.number_input("Fianchi", key="ms_fi")
         if st.button("Salva Misure", key="fs"):
             add_riga_diario("misure", {"peso":p,"alt":a,"collo":co,"vita":vi,"fianchi":fi}, data_filtro)
-            st.success("Misure salvate")
+            notifica("Misure salvate", "📏")
             st.rerun()
 
 # --- TAB 5: SKILLS ---
-with tab5:
+if sezione == SEZIONI[4]:
     st.subheader("🤸 Skills")
     with st.expander("➕ Nuova Skill", expanded=True):
         with st.form("f_cali"):
@@ -886,26 +1311,33 @@ with tab5:
                     add_riga_diario("calisthenics", {"nome": n_sk, "desc": d_sk, "url": u_sk}, data_filtro)
                     st.rerun()
     
-    skills = []
-    if not df.empty:
-        for i, r in df.iterrows():
-            if r['tipo'] == 'calisthenics':
-                try:
-                    d = safe_parse_json(r['dettaglio_json'])
-                    d['idx'] = i; d['dt'] = r['data']
-                    skills.append(d)
-                except: pass
-    
-    if skills:
-        for s in reversed(skills):
+    # Righe lette direttamente dalla tabella condivisa (niente lista di dict per sessione)
+    skills = norm["skills"]
+    if len(skills):
+        for id_s, s in zip(skills.index[::-1], skills.iloc[::-1].itertuples(index=False)):
             with st.container(border=True):
                 ci, ct = st.columns([1, 3])
                 with ci:
-                    if s.get('url'): st.image(s['url'], use_container_width=True)
+                    if s.url: st.image(s.url, use_container_width=True)
                 with ct:
                     c_h, c_d = st.columns([5, 1])
-                    c_h.markdown(f"### {s['nome']}")
-                    if c_d.button("🗑️", key=f"dc_{s['idx']}"): delete_riga(s['idx']); st.rerun()
-                    st.caption(f"📅 {s['dt']}")
-                    st.write(s['desc'])
+                    c_h.markdown(f"### {s.nome}")
+                    if c_d.button("🗑️", key=f"dc_{id_s}"): delete_riga(id_s); st.rerun()
+                    st.caption(f"📅 {s.data.strftime('%Y-%m-%d') if pd.notna(s.data) else ''}")
+                    st.write(s.desc)
     else: st.info("Nessuna skill registrata.")
+
+# ⏱️ Costo della singola interazione (solo la sezione attiva è stata eseguita)
+registra_tempo("pagina", _t_pagina, f"pagina:{sezione}")
+
+# 🛠️ Pannello sviluppatore: tempi per fase, hit/miss della cache, export per confronti tra release
+if DEV:
+    with st.sidebar.expander("🛠️ Performance"):
+        st.caption(f"⏱️ {sezione}: {st.session_state['tempi']['pagina']:.0f} ms")
+        cache_stats = sheet_cache.statistiche()
+        st.dataframe(profilo.tabella().round(1), hide_index=True, use_container_width=True)
+        st.dataframe(cache_stats.round(2), hide_index=True, use_container_width=True)
+        d1, d2 = st.columns(2)
+        d1.download_button("JSON", esporta_json(profilo, cache_stats, {"sezione": sezione}), "profilo.json", "application/json", use_container_width=True)
+        d2.download_button("CSV", esporta_csv(profilo, cache_stats), "profilo.csv", "text/csv", use_container_width=True)
+        if st.button("Azzera", key="prof_reset", use_container_width=True): profilo.azzera(); st.rerun()
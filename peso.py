@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from diario import fetta
+
+# ==========================================
+# 📉 SERIE DEL PESO (trend + downsampling)
+# ==========================================
+FINESTRE = {"1M": pd.DateOffset(months=1), "3M": pd.DateOffset(months=3), "1A": pd.DateOffset(years=1), "Tutto": None}
+
+
+def _giorni(date):
+    """Date -> giorni (float) dal 1970, per interpolazioni e aree"""
+    return date.values.astype("datetime64[s]").astype(np.int64) / 86400.0
+
+
+def serie_peso(misure, halflife=7):
+    """Tabella misure -> serie giornaliera del peso, una riga per giorno con pesata.
+
+    Colonne: data, peso (ultima pesata del giorno), media7 (media mobile 7 giorni),
+    trend (EWMA con emivita in giorni), kg_sett (variazione del trend a settimana).
+    """
+    m = misure.dropna(subset=["peso", "data"])
+    if m.empty: return pd.DataFrame({"data": pd.Series(dtype="datetime64[ns]"), **{c: pd.Series(dtype=float) for c in ["peso", "media7", "trend", "kg_sett"]}})
+    peso = m.groupby(m["data"].dt.normalize())["peso"].last().astype(float)
+    out = pd.DataFrame({"peso": peso, "media7": peso.rolling("7D").mean(),
+                        "trend": peso.ewm(halflife=pd.Timedelta(days=halflife), times=peso.index).mean()})
+    # kg/settimana: trend di oggi meno trend di 7 giorni prima (interpolato), riportato a 7 giorni
+    t, tr = _giorni(out.index), out["trend"].to_numpy()
+    arco = np.minimum(t - t[0], 7.0)
+    prima = np.interp(t - arco, t, tr)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["kg_sett"] = np.where(arco > 0, (tr - prima) / arco * 7.0, np.nan)
+    return out.rename_axis("data").reset_index()
+
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: indici di n punti che conservano la forma della serie"""
+    m = len(x)
+    if n >= m or n < 3: return np.arange(m)
+    bordi = np.linspace(1, m - 1, n - 1).astype(np.int64)  # n-2 bucket interni
+    scelti = np.empty(n, dtype=np.int64)
+    scelti[0], scelti[-1] = 0, m - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = bordi[i], bordi[i + 1]
+        if i < n - 3: nx, ny = x[hi:bordi[i + 2]].mean(), y[hi:bordi[i + 2]].mean()
+        else: nx, ny = x[-1], y[-1]
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        scelti[i + 1] = a
+    return scelti
+
+
+def punti_grafico(serie, finestra="Tutto", max_punti=150):
+    """Righe della serie da disegnare: solo la finestra scelta, al massimo max_punti (LTTB)"""
+    if serie.empty: return serie
+    offset = FINESTRE.get(finestra)
+    s = fetta(serie, serie["data"].iloc[-1] - offset, serie["data"].iloc[-1]) if offset is not None else serie
+    return s.iloc[lttb(_giorni(s["data"]), s["peso"].to_numpy(), max_punti)]
+
+
+def variazione(serie):
+    """Ultima pesata rispetto alla precedente e trend settimanale (None se meno di 2 giorni)"""
+    if len(serie) < 2: return None
+    return {"delta": float(serie["peso"].iloc[-1] - serie["peso"].iloc[-2]), "kg_sett": float(serie["kg_sett"].iloc[-1])}
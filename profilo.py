@@ -0,0 +1,59 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+import pandas as pd
+
+# ==========================================
+# ⏱️ PROFILING PER FASE (fetch, parsing, grafici, AI)
+# ==========================================
+COLONNE = ["fase", "n", "ultimo_ms", "medio_ms", "max_ms", "totale_ms"]
+
+
+class Profilo:
+    """Tempi per fase con nome ("fetch:diario", "normalizza", "tab1:aggregazione", ...).
+
+    Condiviso dal processo: accumula chiamate, ultimo, medio e massimo per fase.
+    """
+
+    def __init__(self):
+        self._fasi = {}  # nome -> [n, ultimo, totale, massimo] (ms)
+        self._lock = threading.Lock()
+        self.inizio = time.time()
+
+    def registra(self, nome, ms):
+        with self._lock:
+            f = self._fasi.setdefault(nome, [0, 0.0, 0.0, 0.0])
+            f[0] += 1; f[1] = ms; f[2] += ms; f[3] = max(f[3], ms)
+
+    @contextmanager
+    def misura(self, nome):
+        t0 = time.perf_counter()
+        try: yield
+        finally: self.registra(nome, (time.perf_counter() - t0) * 1000)
+
+    def ultimo(self, nome):
+        f = self._fasi.get(nome)
+        return f[1] if f else None
+
+    def tabella(self):
+        with self._lock:
+            righe = [(k, n, u, t / n, m, t) for k, (n, u, t, m) in self._fasi.items()]
+        return pd.DataFrame(righe, columns=COLONNE).sort_values("totale_ms", ascending=False, ignore_index=True)
+
+    def azzera(self):
+        with self._lock: self._fasi.clear()
+        self.inizio = time.time()
+
+
+def esporta_json(profilo, cache_stats, meta=None):
+    """Snapshot completo (fasi + hit/miss della cache) per confronti tra release"""
+    return json.dumps({"meta": {"creato": time.strftime("%Y-%m-%d %H:%M:%S"), **(meta or {})},
+                       "fasi": profilo.tabella().round(3).to_dict("records"),
+                       "cache": cache_stats.to_dict("records")}, indent=2)
+
+
+def esporta_csv(profilo, cache_stats):
+    """Una tabella sola: le voci di cache diventano fasi "cache:<voce>" con hit/miss"""
+    cache = cache_stats.rename(columns={"voce": "fase"}).assign(fase=lambda d: "cache:" + d["fase"])
+    return pd.concat([profilo.tabella(), cache], ignore_index=True).to_csv(index=False)
@@ -0,0 +1,169 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+
+from db_engine import nuovo_id
+from diario import SCHEMA, TABELLE, normalizza_diario, id_testo
+
+# ==========================================
+# 📤 EXPORT A BLOCCHI (CSV / Parquet)
+# ==========================================
+# Tabelle esportabili: nome -> tipo nel diario
+ESPORTABILI = {nome: tipo for tipo, nome in TABELLE.items() if nome != "settings"}
+BLOCCO = 10_000  # righe di diario normalizzate per volta
+
+
+def colonne(tabella):
+    return ["id", "data"] + list(SCHEMA[tabella])
+
+
+def blocchi_tabella(sorgenti, tabella, morti=(), righe=BLOCCO):
+    """Sorgenti (frame grezzi del diario: partizioni per anno, diario caldo) -> blocchi della tabella.
+
+    Ogni frame viene normalizzato 'righe' alla volta: in memoria c'è un blocco solo.
+    morti: ID eliminati da tombstone (possono colpire righe di altre sorgenti).
+    """
+    tipo, morti = ESPORTABILI[tabella], set(morti)
+    for df in sorgenti:
+        if df.empty or "tipo" not in df.columns: continue
+        df = df[df["tipo"] == tipo]
+        for i in range(0, len(df), righe):
+            t = normalizza_diario(df.iloc[i:i + righe])[tabella]
+            if morti: t = t.drop(index=list(morti), errors="ignore")
+            if t.empty: continue
+            t = t.reset_index()[colonne(tabella)]
+            # Liste di esercizi: testo JSON (CSV e Parquet restano piatti)
+            if tabella == "allenamenti": t["esercizi"] = [json.dumps(e) for e in t["esercizi"]]
+            yield t
+
+
+def scrivi_csv(blocchi, out):
+    """Blocchi -> CSV su un file di testo aperto, header una volta sola. Restituisce le righe scritte"""
+    n = 0
+    for t in blocchi:
+        t.to_csv(out, index=False, header=(n == 0), date_format="%Y-%m-%d")
+        n += len(t)
+    return n
+
+
+def _schema_parquet(tabella):
+    import pyarrow as pa  # dipendenza di streamlit, importata solo quando serve
+    tipi = {"id": pa.string(), "data": pa.timestamp("ns")}
+    for col, default in SCHEMA[tabella].items():
+        tipi[col] = pa.string() if default is list or isinstance(default, str) else pa.float64()
+    return pa.schema([(c, tipi[c]) for c in colonne(tabella)])
+
+
+def scrivi_parquet(blocchi, out, tabella):
+    """Blocchi -> Parquet (un row group per blocco, schema fisso della tabella). Restituisce le righe scritte"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema, n = _schema_parquet(tabella), 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as w:
+        for t in blocchi:
+            w.write_table(pa.Table.from_pandas(t, schema=schema, preserve_index=False))
+            n += len(t)
+    return n
+
+
+def esporta(sorgenti, tabella, formato="CSV", morti=()):
+    """Export completo -> bytes del file (quello che st.download_button accetta da un callable).
+
+    In memoria restano un blocco normalizzato e il file già scritto, mai la tabella intera.
+    """
+    out = io.BytesIO()
+    blocchi = blocchi_tabella(sorgenti, tabella, morti)
+    if formato == "Parquet": scrivi_parquet(blocchi, out, tabella)
+    else:
+        testo = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        scrivi_csv(blocchi, testo)
+        testo.detach()  # flush senza chiudere il buffer sottostante
+    return out.getvalue()
+
+
+# ==========================================
+# 📥 IMPORT IN BLOCCO (validazione + lotti)
+# ==========================================
+LOTTO = 500  # righe per append
+
+
+def _lista(x):
+    if isinstance(x, list): return x
+    try: return json.loads(x) if isinstance(x, str) else None
+    except ValueError: return None
+
+
+def _numero(col, nome, errori, obbligatorio=False):
+    """Colonna -> float; testo non numerico o valori negativi diventano errori di riga"""
+    v = pd.to_numeric(col.astype(str).str.replace(",", ".", regex=False).replace({"": np.nan, "nan": np.nan}), errors="coerce")
+    pieno = col.notna() & (col.astype(str).str.strip() != "")
+    for i in col.index[(pieno & v.isna()) | (v < 0) | (obbligatorio & v.isna())]:
+        errori.append((i, f"{nome} non valido: {col[i]!r}"))
+    return v
+
+
+def _id_import(x):
+    """ID di un file importato -> stessa forma che il diario rilegge dal foglio (append USER_ENTERED).
+
+    Un ID di sole cifre il foglio lo salva come numero: si usa subito la forma di id_testo
+    (12 cifre), così un secondo import dello stesso file trova gli ID già presenti. Altri ID
+    numerici (decimali, esponenti, troppe cifre per un double) non tornerebbero uguali: prefisso "i".
+    """
+    if x in ("", "nan"): return nuovo_id()
+    v = pd.to_numeric(x, errors="coerce")
+    if pd.isna(v): return x
+    return id_testo(v) if float(v).is_integer() and abs(v) < 1e15 else f"i{x}"
+
+
+def valida_import(df, tabella):
+    """CSV di una tabella (stesse colonne dell'export) -> (righe di diario pronte, errori [(riga, motivo)]).
+
+    Obbligatori: data; nome per pasti e skill; almeno una misura per misure; ml per acqua.
+    Le righe con errori vengono scartate, le altre importate. Se c'è la colonna id viene
+    mantenuta nella forma che il foglio restituisce (_id_import): un secondo import dello
+    stesso file non duplica niente.
+    """
+    tipo, schema, errori = ESPORTABILI[tabella], SCHEMA[tabella], []
+    df = df.reset_index(drop=True)
+    date = pd.to_datetime(df["data"], errors="coerce", format="mixed") if "data" in df.columns else pd.Series(pd.NaT, index=df.index)
+    for i in df.index[date.isna()]: errori.append((i, "data mancante o non valida"))
+    campi = {}
+    for col, default in schema.items():
+        if col not in df.columns: continue
+        if default is list:
+            liste = [_lista(x) for x in df[col]]
+            for i, x in zip(df.index, liste):
+                if not isinstance(x, list): errori.append((i, f"{col} non è una lista JSON"))
+            campi[col] = pd.Series(liste, index=df.index)
+        elif isinstance(default, str): campi[col] = df[col].fillna(default).astype(str).str.strip()
+        else: campi[col] = _numero(df[col], col, errori, obbligatorio=(tabella == "acqua" and col == "ml"))
+    if tabella in ("pasti", "skills"):
+        nome = campi.get("nome", pd.Series("", index=df.index))
+        for i in df.index[nome == ""]: errori.append((i, "nome mancante"))
+    if tabella == "misure":
+        vuote = pd.DataFrame(campi, index=df.index).isna().all(axis=1) if campi else pd.Series(True, index=df.index)
+        for i in df.index[vuote]: errori.append((i, "nessuna misura"))
+    if tabella == "acqua" and "ml" not in campi:
+        errori += [(i, "ml mancante") for i in df.index]
+    scarta = {i for i, _ in errori}
+    ok = [i for i in df.index if i not in scarta]
+    recs = pd.DataFrame(campi, index=df.index).loc[ok].to_dict("records")
+    # Solo i campi valorizzati finiscono nel JSON (come le righe scritte dall'app)
+    dettagli = [json.dumps({k: v for k, v in r.items() if not (isinstance(v, float) and np.isnan(v))}) for r in recs]
+    ids = df["id"].fillna("").astype(str).str.strip() if "id" in df.columns else pd.Series("", index=df.index)
+    righe = pd.DataFrame({"data": date[ok].dt.strftime("%Y-%m-%d").to_numpy(), "tipo": tipo, "dettaglio_json": dettagli,
+                          "id": [_id_import(x) for x in ids[ok]]})
+    return righe, sorted(errori)
+
+
+def lotti(righe, esistenti=(), n=LOTTO):
+    """Righe validate -> lotti da n per l'append, senza gli ID già presenti nel diario"""
+    righe = righe[~righe["id"].isin(set(esistenti))].drop_duplicates("id")
+    for i in range(0, len(righe), n): yield righe.iloc[i:i + n]
+
+
+def leggi_file(dati, nome_file):
+    """File caricato (bytes) -> DataFrame: .parquet o CSV"""
+    if nome_file.lower().endswith(".parquet"): return pd.read_parquet(io.BytesIO(dati))
+    return pd.read_csv(io.BytesIO(dati), dtype=str, keep_default_na=False)
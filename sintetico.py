@@ -0,0 +1,152 @@
+"""Dati sintetici e connessione finta per benchmark e prove senza Google Sheets."""
+import json
+import random
+import pandas as pd
+
+from db_engine import MemorySheetBackend
+from diario import SETTINGS_DEFAULT, kv_da_settings
+
+# ==========================================
+# 🧪 GENERATORI (stessi dettaglio_json scritti dall'app)
+# ==========================================
+BASI_CIBO = ["Riso", "Pasta", "Pollo", "Manzo", "Tonno", "Salmone", "Mela", "Banana", "Yogurt", "Latte",
+             "Pane", "Avena", "Uova", "Formaggio", "Prosciutto", "Patate", "Fagioli", "Lenticchie", "Mandorle", "Cioccolato"]
+VARIANTI = ["integrale", "bio", "light", "al naturale", "cotto", "crudo", "greco", "affumicato", "di semola", "proteico"]
+MARCHE = ["Coop", "Esselunga", "Conad", "Barilla", "Mulino"]
+ESERCIZI = {
+    "Pesi": ["Panca piana", "Squat", "Stacco", "Military press", "Rematore", "Curl bilanciere", "Lat machine", "Affondi"],
+    "Calisthenics": ["Trazioni", "Dip", "Push up", "Muscle up", "Pistol squat"],
+    "Isometria": ["Plank", "L-sit", "Front lever", "Hollow hold"],
+    "Abs": ["Crunch", "Leg raise", "Russian twist", "Ab wheel"],
+}
+SKILL = ["Handstand", "L-sit", "Front lever", "Back lever", "Planche lean", "Muscle up", "Human flag"]
+
+
+def catalogo_sintetico(n, seed=0):
+    """Catalogo cibi finto: nomi composti da basi + varianti"""
+    rnd = random.Random(seed)
+    nomi = [f"{rnd.choice(BASI_CIBO)} {rnd.choice(VARIANTI)} {rnd.choice(MARCHE)} #{i}" for i in range(n)]
+    return pd.DataFrame({"nome": nomi, "kcal": [rnd.randint(20, 600) for _ in range(n)], "pro": 10.0, "carb": 20.0, "fat": 5.0})
+
+
+def integratori_sintetici(n=30, seed=0):
+    rnd = random.Random(seed)
+    nomi = ["Whey", "Creatina", "Caseine", "Omega 3", "Vitamina D", "Magnesio", "Multivitaminico", "BCAA", "Zinco", "Caffeina"]
+    return pd.DataFrame([{"nome": f"{nomi[i % len(nomi)]}{'' if i < len(nomi) else f' #{i}'}", "tipo": rnd.choice(["g", "cps", "mg"]),
+                          "kcal": round(rnd.uniform(0, 4), 2), "pro": round(rnd.uniform(0, 0.9), 2),
+                          "carb": round(rnd.uniform(0, 0.2), 2), "fat": round(rnd.uniform(0, 0.1), 2)} for i in range(n)])
+
+
+def esercizi_sintetici():
+    return pd.DataFrame([{"nome": nome, "categoria": cat} for cat, nomi in ESERCIZI.items() for nome in nomi])
+
+
+def _esercizio(rnd):
+    tipo = rnd.choices(["pesi", "calisthenics", "isometria", "abs", "cardio"], weights=[6, 2, 1, 1, 1])[0]
+    if tipo == "pesi":
+        return {"type": "pesi", "nome": rnd.choice(ESERCIZI["Pesi"]), "serie": rnd.randint(3, 5), "reps": rnd.randint(5, 12), "kg": float(rnd.randrange(20, 140, 5))}
+    if tipo == "calisthenics":
+        return {"type": "calisthenics", "nome": rnd.choice(ESERCIZI["Calisthenics"]), "serie": rnd.randint(3, 5), "reps": rnd.randint(5, 15), "kg": float(rnd.choice([0, 0, 5, 10]))}
+    if tipo == "isometria":
+        return {"type": "isometria", "nome": rnd.choice(ESERCIZI["Isometria"]), "serie": rnd.randint(3, 5), "tempo": rnd.randrange(10, 90, 5), "kg": float(rnd.choice([0, 0, 2.5, 5]))}
+    if tipo == "abs":
+        return {"type": "abs", "nome": rnd.choice(ESERCIZI["Abs"]), "serie": 3, "reps": rnd.randrange(10, 30, 5), "kg": float(rnd.choice([0, 0, 5]))}
+    return {"type": "cardio", "nome": rnd.choice(["Corsa", "Bici", "Camminata"]), "km": round(rnd.uniform(2, 12), 1), "tempo": rnd.randint(15, 70), "kcal": rnd.randint(100, 700)}
+
+
+def _giornata(rnd, giorno, cibi, peso):
+    """Righe (tipo, dettaglio) di un giorno tipico"""
+    righe = []
+    for cat in ["Colazione", "Pranzo", "Cena"] + ["Spuntino"] * rnd.randint(0, 2):
+        for _ in range(rnd.randint(1, 3)):
+            nome, kcal = cibi[rnd.randrange(len(cibi))]
+            gr = float(rnd.randrange(30, 250, 10)); f = gr / 100
+            righe.append(("pasto", {"pasto": cat, "nome": nome, "gr": gr, "unita": "g", "cal": kcal * f, "pro": 10.0 * f, "carb": 20.0 * f, "fat": 5.0 * f}))
+    if rnd.random() < 0.5:
+        righe.append(("pasto", {"pasto": "Integrazione", "nome": "Whey", "gr": 30.0, "unita": "g", "cal": 120.0, "pro": 24.0, "carb": 3.0, "fat": 1.5}))
+    righe += [("acqua", {"ml": 250})] * rnd.randint(2, 8)
+    if rnd.random() < 0.8: righe.append(("misure", {"peso": round(peso, 1)}))
+    if giorno.dayofweek == 6:
+        righe.append(("misure", {"peso": round(peso, 1), "alt": 178, "collo": round(rnd.uniform(37, 40), 1), "vita": round(rnd.uniform(78, 90), 1), "fianchi": round(rnd.uniform(90, 100), 1)}))
+    if rnd.random() < 0.5:
+        righe.append(("allenamento", {"nome_sessione": rnd.choice(["Push", "Pull", "Legs", "Full body", "Workout"]), "durata": rnd.randrange(30, 120, 5),
+                                      "esercizi": [_esercizio(rnd) for _ in range(rnd.randint(3, 7))]}))
+    if rnd.random() < 0.03:
+        righe.append(("calisthenics", {"nome": rnd.choice(SKILL), "desc": "Progressione registrata", "url": ""}))
+    return righe
+
+
+def diario_sintetico(n, seed=0, inizio="2015-01-01", con_id=True, settings=True):
+    """Diario realistico di n righe: pasti, integrazione, acqua, misure, allenamenti con esercizi,
+    skill calisthenics e (se settings) qualche snapshot 'settings' del vecchio formato."""
+    rnd = random.Random(seed)
+    cibi = list(zip(*catalogo_sintetico(200, seed)[["nome", "kcal"]].to_dict("list").values()))
+    giorno, peso, righe = pd.Timestamp(inizio), 82.0, []
+    while len(righe) < n:
+        peso += rnd.gauss(-0.01, 0.25)
+        d = giorno.strftime("%Y-%m-%d")
+        righe += [(d, tipo, json.dumps(dati)) for tipo, dati in _giornata(rnd, giorno, cibi, peso)]
+        if settings and giorno.day == 1 and giorno.month == 1:
+            righe.append((d, "settings", json.dumps({**SETTINGS_DEFAULT, "target_cal": rnd.choice([2200, 2400, 2600])})))
+        giorno += pd.Timedelta(days=1)
+    df = pd.DataFrame(righe[:n], columns=["data", "tipo", "dettaglio_json"])
+    if con_id: df["id"] = [f"r{rnd.getrandbits(44):011x}" for _ in range(len(df))]
+    return df
+
+
+def fogli_sintetici(n_diario, n_cibi=2_000, seed=0):
+    """Tutti i fogli dell'app, pronti per MemorySheetBackend"""
+    return {"diario": diario_sintetico(n_diario, seed), "cibi": catalogo_sintetico(n_cibi, seed),
+            "integratori": integratori_sintetici(seed=seed), "esercizi": esercizi_sintetici(),
+            "settings": kv_da_settings(SETTINGS_DEFAULT)}
+
+
+# ==========================================
+# 🔌 CONNESSIONE FINTA (al posto di GSheetsConnection)
+# ==========================================
+CONNESSIONE = None  # quella restituita a st.connection quando l'app gira sotto AppTest
+
+class _WorksheetFinto:
+    def __init__(self, mem, nome):
+        self.mem, self.nome = mem, nome
+
+    def append_rows(self, values, value_input_option=None):
+        self.mem._rete()
+        header, rows = self.mem.sheets[self.nome]
+        rows.extend(values)
+        self.mem.celle_inviate += len(values) * len(header)
+
+
+class WorksheetNotFound(Exception):
+    """Stesso nome dell'eccezione di gspread (GSheetsBackend la riconosce per nome)"""
+
+
+class SpreadsheetFinto:
+    """Al posto di gspread.Spreadsheet: worksheet(nome) per gli append"""
+
+    def __init__(self, mem):
+        self.mem = mem
+
+    def worksheet(self, nome):
+        if nome not in self.mem.sheets: raise WorksheetNotFound(nome)
+        return _WorksheetFinto(self.mem, nome)
+
+
+class ConnessioneFinta:
+    """Stessa interfaccia usata da GSheetsBackend (read/update/create), dati in memoria;
+    spreadsheet è quello che apri_spreadsheet restituisce sotto AppTest"""
+
+    def __init__(self, mem=None, latenza=0.0):
+        self.mem = mem or MemorySheetBackend(latenza=latenza)
+        self.spreadsheet = SpreadsheetFinto(self.mem)
+
+    def read(self, worksheet=None, ttl=None, **kw):
+        if worksheet not in self.mem.sheets: raise WorksheetNotFound(worksheet)
+        return self.mem.read(worksheet)
+
+    def update(self, worksheet=None, data=None):
+        if worksheet not in self.mem.sheets: raise WorksheetNotFound(worksheet)
+        self.mem.update(worksheet, data)
+
+    def create(self, worksheet=None, data=None):
+        self.mem.update(worksheet, data)